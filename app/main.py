@@ -3,15 +3,17 @@ Main FastAPI application for Hustle backend.
 """
 
 from fastapi import FastAPI, Request, status
-from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import os
-import time
 
-from app.database import init_db, close_db
+from app.database import init_db, close_db, close_async_db
+from app.middleware import ContentLengthLimitMiddleware, FastCORSMiddleware, ProcessTimeMiddleware
 from app.routers import sellers, products, catalog, webhook
-from app.services.logging import log_error
+from app.routers.products import MAX_REQUEST_SIZE
+from app.services.http import close_http_clients
+from app.services.logging import log_error, start_log_worker, stop_log_worker
+from app.services.whatsapp import close_whatsapp_client
 
 # Create FastAPI app
 app = FastAPI(
@@ -19,7 +21,8 @@ app = FastAPI(
     description="WhatsApp-first private catalog for informal sellers",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
@@ -28,8 +31,12 @@ allowed_origins = os.getenv(
     "http://localhost:3000,http://localhost:19006,http://localhost:8081"
 ).split(",")
 
+# Reject oversize uploads from Content-Length before reading the body.
+# Added before CORS so the 413 still carries CORS headers.
+app.add_middleware(ContentLengthLimitMiddleware, max_body_size=MAX_REQUEST_SIZE)
+
 app.add_middleware(
-    CORSMiddleware,
+    FastCORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
@@ -38,14 +45,7 @@ app.add_middleware(
 
 
 # Request timing middleware
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """Add processing time header to responses."""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+app.add_middleware(ProcessTimeMiddleware)
 
 
 # Global exception handler
@@ -77,10 +77,23 @@ app.include_router(products.router, prefix="/api/v1")
 app.include_router(catalog.router, prefix="/api/v1")
 app.include_router(webhook.router, prefix="/api/v1")
 
+# Uploaded images get a fresh UUID filename and are never rewritten in place
+UPLOADS_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that lets browsers cache responses long-term."""
+    
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = UPLOADS_CACHE_CONTROL
+        return response
+
+
 # Mount uploads directory for serving images
 upload_dir = os.getenv("UPLOAD_DIR", "uploads")
 os.makedirs(upload_dir, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
+app.mount("/uploads", CachedStaticFiles(directory=upload_dir), name="uploads")
 
 
 @app.on_event("startup")
@@ -89,6 +102,7 @@ async def startup_event():
     print("🚀 Starting Hustle API...")
     init_db()
     print("✅ Database initialized")
+    start_log_worker()
     print(f"📁 Upload directory: {upload_dir}")
     print(f"🌐 CORS origins: {allowed_origins}")
 
@@ -97,8 +111,12 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown."""
     print("🛑 Shutting down Hustle API...")
+    await stop_log_worker()
     close_db()
+    await close_async_db()
     print("✅ Database connections closed")
+    await close_http_clients()
+    await close_whatsapp_client()
 
 
 @app.get("/")
@@ -0,0 +1,125 @@
+"""
+ASGI middleware for Hustle backend.
+Implemented as plain ASGI callables to avoid BaseHTTPMiddleware overhead.
+"""
+
+import time
+from typing import Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class ProcessTimeMiddleware:
+    """Add an X-Process-Time header with the request handling duration."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                process_time = time.perf_counter() - start_time
+                headers = list(message.get("headers", []))
+                headers.append((b"x-process-time", f"{process_time:.4f}".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class ContentLengthLimitMiddleware:
+    """
+    Reject requests whose declared Content-Length exceeds a limit with 413,
+    before any of the body is read. Bodies without a Content-Length (chunked)
+    are still capped by the streaming upload code.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            content_length = Headers(scope=scope).get("content-length", "")
+            if content_length.isdigit() and int(content_length) > self.max_body_size:
+                response = JSONResponse(
+                    {"detail": "Request body too large"},
+                    status_code=413
+                )
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class FastCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware with the simple-response path precomputed.
+    Header values are encoded once at startup and appended straight onto the
+    raw ASGI header list instead of going through MutableHeaders.update().
+    CORS headers the response already carries are dropped first, so each
+    is sent once.
+    """
+
+    def __init__(self, app: ASGIApp, allow_origins: Sequence[str] = (), **kwargs):
+        super().__init__(app, allow_origins=allow_origins, **kwargs)
+        self._allow_origins_set = frozenset(allow_origins)
+        self._simple_raw_headers = [
+            (key.lower().encode("latin-1"), value.encode("latin-1"))
+            for key, value in self.simple_headers.items()
+        ]
+        # Used when the origin is mirrored back, so "*" is never sent alongside it
+        self._simple_raw_headers_no_origin = [
+            header for header in self._simple_raw_headers
+            if header[0] != b"access-control-allow-origin"
+        ]
+        self._simple_header_names = frozenset(
+            [name for name, _ in self._simple_raw_headers]
+            + [b"access-control-allow-origin"]
+        )
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        if self.allow_all_origins or origin in self._allow_origins_set:
+            return True
+        return (
+            self.allow_origin_regex is not None
+            and self.allow_origin_regex.fullmatch(origin) is not None
+        )
+
+    async def send(
+        self, message: Message, send: Send, request_headers: Headers
+    ) -> None:
+        if message["type"] != "http.response.start":
+            await send(message)
+            return
+
+        origin = request_headers["origin"]
+        if self.allow_all_origins:
+            explicit_origin = "cookie" in request_headers
+        else:
+            explicit_origin = self.is_allowed_origin(origin)
+
+        names = self._simple_header_names
+        headers = [
+            header for header in message.get("headers", [])
+            if header[0].lower() not in names
+        ]
+        if explicit_origin:
+            headers.extend(self._simple_raw_headers_no_origin)
+            headers.append((b"access-control-allow-origin", origin.encode("latin-1")))
+            message["headers"] = headers
+            MutableHeaders(scope=message).add_vary_header("Origin")
+        else:
+            headers.extend(self._simple_raw_headers)
+            message["headers"] = headers
+
+        await send(message)
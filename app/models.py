@@ -4,14 +4,15 @@ Defines Seller, Product, Interest, and ActionLog entities.
 """
 
 from sqlalchemy import (
-    Column, Integer, String, Boolean, DateTime, 
-    Text, ForeignKey, Numeric, Index, event
+    Column, String, Boolean, DateTime, BigInteger,
+    Text, ForeignKey, Numeric, Index, DDL, event, select, text
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+from typing import Optional
 
 from app.database import Base
 
@@ -30,11 +31,32 @@ class Seller(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     last_login = Column(DateTime(timezone=True), nullable=True)
+    # Maintained by a trigger on action_logs (see below). Part of the table
+    # but not mapped, so seller queries work on databases that have not run
+    # migrations/seller_catalog_views.sql yet; read it via the table column.
+    catalog_views = Column(BigInteger, server_default=text('0'), nullable=False)
     
     # Relationships
-    products = relationship("Product", back_populates="seller", cascade="all, delete-orphan")
+    products = relationship(
+        "Product",
+        back_populates="seller",
+        cascade="all, delete-orphan",
+        order_by="Product.created_at.desc()"
+    )
     action_logs = relationship("ActionLog", back_populates="seller", cascade="all, delete-orphan")
     
+    __mapper_args__ = {"exclude_properties": ["catalog_views"]}
+    
+    # Indexes for performance
+    __table_args__ = (
+        # Partial index serving the catalog lookup (slug + active only)
+        Index(
+            'idx_seller_slug_active',
+            'catalog_slug',
+            postgresql_where=text('is_active = true')
+        ),
+    )
+    
     def __repr__(self):
         return f"<Seller(phone={self.phone_number}, slug={self.catalog_slug})>"
     
@@ -47,7 +69,7 @@ class Seller(Base):
             "catalog_url": f"/catalog/{self.catalog_slug}",
             "is_active": self.is_active,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "product_count": len([p for p in self.products if p.is_active])
+            "product_count": self.product_count
         }
 
 
@@ -79,12 +101,20 @@ class Product(Base):
     __table_args__ = (
         Index('idx_product_seller_active', 'seller_id', 'is_active'),
         Index('idx_product_created', 'created_at'),
+        # Partial index serving the catalog and seller product list
+        # (active products of a seller, newest first)
+        Index(
+            'idx_product_seller_active_created',
+            'seller_id',
+            text('created_at DESC'),
+            postgresql_where=text('is_active = true')
+        ),
     )
     
     def __repr__(self):
         return f"<Product(name={self.name}, seller={self.seller_id})>"
     
-    def to_dict(self, include_seller=False):
+    def to_dict(self, include_seller=False, now: Optional[datetime] = None):
         data = {
             "id": str(self.id),
             "name": self.name,
@@ -94,7 +124,7 @@ class Product(Base):
             "image_url": self.image_url,
             "is_active": self.is_active,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "can_undo": self.can_undo() if not self.is_active else False
+            "can_undo": self.can_undo(now) if not self.is_active else False
         }
         if include_seller and self.seller:
             data["seller"] = {
@@ -104,11 +134,26 @@ class Product(Base):
             }
         return data
     
-    def can_undo(self) -> bool:
-        """Check if product removal can be undone (within 30 seconds)."""
+    def can_undo(self, now: Optional[datetime] = None) -> bool:
+        """
+        Check if product removal can be undone (within 30 seconds).
+        Pass `now` when checking many products so the clock is read once.
+        """
         if self.is_active or not self.can_undo_until:
             return False
-        return datetime.utcnow() < self.can_undo_until
+        if now is None:
+            now = datetime.now(timezone.utc)
+        return now < self.can_undo_until
+
+
+# Active product count, computed in SQL instead of loading the collection
+Seller.product_count = column_property(
+    select(func.count(Product.id))
+    .where(Product.seller_id == Seller.id, Product.is_active == True)
+    .correlate_except(Product)
+    .scalar_subquery(),
+    deferred=True
+)
 
 
 class Interest(Base):
@@ -176,8 +221,8 @@ class ActionLog(Base):
     product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="SET NULL"), nullable=True, index=True)
     interest_id = Column(UUID(as_uuid=True), ForeignKey("interests.id", ondelete="SET NULL"), nullable=True)
     
-    # Detailed action data (JSON-like storage)
-    action_data = Column(Text, nullable=True)  # JSON string of action details
+    # Detailed action data
+    action_data = Column(JSONB, nullable=True)
     
     # Metadata
     ip_address = Column(String(45), nullable=True)
@@ -195,6 +240,13 @@ class ActionLog(Base):
     __table_args__ = (
         Index('idx_action_log_seller_time', 'seller_id', 'created_at'),
         Index('idx_action_log_type_time', 'action_type', 'created_at'),
+        # Per-seller counts and listings of one action type (e.g. catalog views)
+        Index(
+            'idx_action_log_seller_type_time',
+            'seller_id',
+            'action_type',
+            text('created_at DESC')
+        ),
     )
     
     def __repr__(self):
@@ -213,36 +265,31 @@ class ActionLog(Base):
         }
 
 
-# Event listeners for automatic logging
-@event.listens_for(Product, 'after_insert')
-def log_product_insert(mapper, connection, target):
-    """Log when a new product is created."""
-    from app.services.logging import log_action
-    log_action(
-        action_type=ActionLog.PRODUCT_UPLOADED,
-        seller_id=target.seller_id,
-        product_id=target.id,
-        action_data={"product_name": target.name, "price": str(target.price) if target.price else None}
-    )
+# Keep Seller.catalog_views in step with CATALOG_VIEWED log rows, so stats
+# read a counter instead of counting the whole log
+_bump_catalog_views_fn = DDL("""
+CREATE OR REPLACE FUNCTION bump_seller_catalog_views() RETURNS trigger AS $$
+BEGIN
+    UPDATE sellers SET catalog_views = catalog_views + 1 WHERE id = NEW.seller_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""")
 
+_bump_catalog_views_trigger = DDL(f"""
+CREATE TRIGGER trg_action_logs_catalog_views
+AFTER INSERT ON action_logs
+FOR EACH ROW WHEN (NEW.action_type = '{ActionLog.CATALOG_VIEWED}')
+EXECUTE FUNCTION bump_seller_catalog_views()
+""")
 
-@event.listens_for(Product, 'after_update')
-def log_product_update(mapper, connection, target):
-    """Log when a product is updated (removed/restored)."""
-    from app.services.logging import log_action
-    # Check if product was just removed
-    if hasattr(target, '_was_removed') and target._was_removed:
-        log_action(
-            action_type=ActionLog.PRODUCT_REMOVED,
-            seller_id=target.seller_id,
-            product_id=target.id,
-            action_data={"product_name": target.name, "removed_at": datetime.utcnow().isoformat()}
-        )
-    # Check if product was restored
-    if hasattr(target, '_was_restored') and target._was_restored:
-        log_action(
-            action_type=ActionLog.PRODUCT_RESTORED,
-            seller_id=target.seller_id,
-            product_id=target.id,
-            action_data={"product_name": target.name, "restored_at": datetime.utcnow().isoformat()}
-        )
+event.listen(
+    ActionLog.__table__,
+    "after_create",
+    _bump_catalog_views_fn.execute_if(dialect="postgresql")
+)
+event.listen(
+    ActionLog.__table__,
+    "after_create",
+    _bump_catalog_views_trigger.execute_if(dialect="postgresql")
+)
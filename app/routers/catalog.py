@@ -2,34 +2,120 @@
 API endpoints for the public catalog (buyer view).
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from functools import lru_cache
+import hashlib
+from typing import Optional
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from uuid import UUID
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import Seller, Product, Interest, ActionLog
-from app.schemas import CatalogResponse, CatalogProductResponse, InterestCreate, InterestResponse
+from app.schemas import CatalogResponse, InterestCreate, InterestResponse
 from app.services.logging import log_action
 from app.services.whatsapp import whatsapp_service
 
 router = APIRouter(prefix="/catalog", tags=["Catalog"])
 
+# Buyers may keep a copy but must revalidate it with the ETag
+CATALOG_CACHE_CONTROL = "private, must-revalidate"
+
+# Statements are built once at import; handlers only bind parameters.
+# Active seller by slug, with active products joined in. Only the product
+# columns the buyer view and ETag need are fetched.
+_CATALOG_BY_SLUG = select(Seller).options(
+    joinedload(Seller.products.and_(Product.is_active == True)).load_only(
+        Product.id,
+        Product.name,
+        Product.description,
+        Product.price,
+        Product.currency,
+        Product.image_url,
+        Product.created_at,
+        Product.updated_at
+    )
+).where(
+    Seller.catalog_slug == bindparam("slug"),
+    Seller.is_active == True
+)
+
+_ACTIVE_SELLER_BY_SLUG = select(Seller).where(
+    Seller.catalog_slug == bindparam("slug"),
+    Seller.is_active == True
+)
+
+_ACTIVE_SELLER_PRODUCT = select(Product).where(
+    Product.id == bindparam("product_id"),
+    Product.seller_id == bindparam("seller_id"),
+    Product.is_active == True
+)
+
+
+def _build_interest_message(name: str, price: Optional[str] = None) -> str:
+    """Build the pre-filled message a buyer sends about a product."""
+    message = f"Hi! I'm interested in your product: {name}"
+    if price:
+        message += f" (priced at ${price})"
+    return message + ". Is it still available?"
+
+
+def _catalog_etag(seller: Seller, products: list) -> str:
+    """
+    ETag for a catalog page.
+    Changes whenever the seller or any listed product is updated, or a
+    product is added to or removed from the catalog.
+    """
+    last_modified = max(
+        (p.updated_at or p.created_at for p in products),
+        default=None
+    )
+    key = f"{seller.updated_at}:{last_modified}:{len(products)}"
+    return '"' + hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+
+@lru_cache(maxsize=4096)
+def _cached_deep_link(phone_number: str, name: str, price: Optional[str] = None) -> str:
+    """
+    WhatsApp deep link for a product, cached on the fields it is built from.
+    An edited name or price produces a new key, so stale links are never served.
+    """
+    return whatsapp_service.generate_whatsapp_deep_link(
+        phone_number=phone_number,
+        message=_build_interest_message(name, price)
+    )
+
 
 @router.get("/{catalog_slug}", response_model=CatalogResponse)
 async def view_catalog(
     catalog_slug: str,
     request: Request,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     View a seller's public catalog.
     This is the page buyers see when they click the catalog link.
+    Supports conditional requests: a matching If-None-Match returns 304.
+    The payload is returned as an ORJSONResponse directly, skipping
+    response_model validation on this hot path.
     """
-    # Find seller by catalog slug
-    seller = db.query(Seller).filter(
-        Seller.catalog_slug == catalog_slug,
-        Seller.is_active == True
-    ).first()
+    client_host = request.client.host if request.client else None
+    user_agent = request.headers.get("user-agent")
+    
+    # Find seller by catalog slug, loading active products in the same query
+    result = await db.execute(_CATALOG_BY_SLUG, {"slug": catalog_slug})
+    seller = result.unique().scalar_one_or_none()
     
     if not seller:
         raise HTTPException(
@@ -37,54 +123,54 @@ async def view_catalog(
             detail="Catalog not found or unavailable"
         )
     
-    # Get active products
-    products = db.query(Product).filter(
-        Product.seller_id == seller.id,
-        Product.is_active == True
-    ).order_by(Product.created_at.desc()).all()
+    products = seller.products
     
-    # Log catalog view
-    log_action(
+    # Log catalog view after the response is sent
+    background_tasks.add_task(
+        log_action,
         action_type=ActionLog.CATALOG_VIEWED,
         seller_id=seller.id,
-        ip_address=request.client.host if request.client else None,
-        user_agent=request.headers.get("user-agent"),
+        ip_address=client_host,
+        user_agent=user_agent,
         action_data={
             "catalog_slug": catalog_slug,
             "product_count": len(products)
         }
     )
     
+    # Repeat visit with nothing changed - skip building the payload
+    etag = _catalog_etag(seller, products)
+    cache_headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
     # Build response with WhatsApp deep links
     catalog_products = []
     for product in products:
-        # Generate pre-filled message
-        message = f"Hi! I'm interested in your product: {product.name}"
-        if product.price:
-            message += f" (priced at ${product.price})"
-        message += ". Is it still available?"
-        
-        whatsapp_link = whatsapp_service.generate_whatsapp_deep_link(
-            phone_number=seller.phone_number,
-            message=message
+        whatsapp_link = _cached_deep_link(
+            seller.phone_number,
+            product.name,
+            str(product.price) if product.price else None
         )
         
-        catalog_products.append(CatalogProductResponse(
-            id=product.id,
-            name=product.name,
-            description=product.description,
-            price=float(product.price) if product.price else None,
-            currency=product.currency,
-            image_url=product.image_url,
-            seller_name=seller.name,
-            whatsapp_link=whatsapp_link
-        ))
-    
-    return CatalogResponse(
-        seller_name=seller.name,
-        seller_phone=seller.phone_number,
-        products=catalog_products,
-        total_products=len(catalog_products)
+        catalog_products.append({
+            "id": str(product.id),
+            "name": product.name,
+            "description": product.description,
+            "price": float(product.price) if product.price else None,
+            "currency": product.currency,
+            "image_url": product.image_url,
+            "seller_name": seller.name,
+            "whatsapp_link": whatsapp_link
+        })
+    
+    return ORJSONResponse(
+        {
+            "seller_name": seller.name,
+            "seller_phone": seller.phone_number,
+            "products": catalog_products,
+            "total_products": len(catalog_products)
+        },
+        headers=cache_headers
     )
 
 
@@ -93,17 +179,20 @@ async def register_interest(
     catalog_slug: str,
     interest: InterestCreate,
     request: Request,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Register buyer interest in a product.
     Creates an interest record and returns WhatsApp deep link.
     """
+    client_host = request.client.host if request.client else None
+    user_agent = request.headers.get("user-agent")
+    
     # Find seller
-    seller = db.query(Seller).filter(
-        Seller.catalog_slug == catalog_slug,
-        Seller.is_active == True
-    ).first()
+    seller = (await db.execute(
+        _ACTIVE_SELLER_BY_SLUG, {"slug": catalog_slug}
+    )).scalar_one_or_none()
     
     if not seller:
         raise HTTPException(
@@ -112,11 +201,9 @@ async def register_interest(
         )
     
     # Find product
-    product = db.query(Product).filter(
-        Product.id == interest.product_id,
-        Product.seller_id == seller.id,
-        Product.is_active == True
-    ).first()
+    product = (await db.execute(
+        _ACTIVE_SELLER_PRODUCT, {"product_id": interest.product_id, "seller_id": seller.id}
+    )).scalar_one_or_none()
     
     if not product:
         raise HTTPException(
@@ -124,43 +211,37 @@ async def register_interest(
             detail="Product not found or no longer available"
         )
     
-    # Create interest record
+    # Generate WhatsApp deep link
+    whatsapp_link = _cached_deep_link(
+        seller.phone_number,
+        product.name,
+        str(product.price) if product.price else None
+    )
+    
+    # Create interest record, already marked as sent since the link is ready.
+    # id is generated client-side and created_at comes back via RETURNING,
+    # so a single commit is enough.
     interest_record = Interest(
         product_id=interest.product_id,
         buyer_phone=interest.buyer_phone,
         buyer_name=interest.buyer_name,
-        buyer_ip=request.client.host if request.client else None,
-        user_agent=request.headers.get("user-agent"),
-        message_sent=False
+        buyer_ip=client_host,
+        user_agent=user_agent,
+        message_sent=True
     )
     
     db.add(interest_record)
-    db.commit()
-    db.refresh(interest_record)
-    
-    # Generate WhatsApp deep link
-    message = f"Hi! I'm interested in your product: {product.name}"
-    if product.price:
-        message += f" (priced at ${product.price})"
-    message += ". Is it still available?"
-    
-    whatsapp_link = whatsapp_service.generate_whatsapp_deep_link(
-        phone_number=seller.phone_number,
-        message=message
-    )
-    
-    # Update interest as message sent
-    interest_record.message_sent = True
-    db.commit()
+    await db.commit()
     
-    # Log interest
-    log_action(
+    # Log interest after the response is sent
+    background_tasks.add_task(
+        log_action,
         action_type=ActionLog.BUYER_INTEREST,
         seller_id=seller.id,
         product_id=product.id,
         interest_id=interest_record.id,
-        ip_address=request.client.host if request.client else None,
-        user_agent=request.headers.get("user-agent"),
+        ip_address=client_host,
+        user_agent=user_agent,
         action_data={
             "product_name": product.name,
             "buyer_name": interest.buyer_name,
@@ -168,8 +249,9 @@ async def register_interest(
         }
     )
     
-    # Notify seller via WhatsApp
-    await whatsapp_service.send_interest_notification(
+    # Notify seller via WhatsApp after the response is sent
+    background_tasks.add_task(
+        whatsapp_service.send_interest_notification,
         to=seller.phone_number,
         buyer_name=interest.buyer_name,
         product_name=product.name
@@ -190,13 +272,12 @@ async def register_interest(
 async def view_product_detail(
     catalog_slug: str,
     product_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """View a single product detail (for sharing individual products)."""
-    seller = db.query(Seller).filter(
-        Seller.catalog_slug == catalog_slug,
-        Seller.is_active == True
-    ).first()
+    seller = (await db.execute(
+        _ACTIVE_SELLER_BY_SLUG, {"slug": catalog_slug}
+    )).scalar_one_or_none()
     
     if not seller:
         raise HTTPException(
@@ -204,11 +285,9 @@ async def view_product_detail(
             detail="Catalog not found"
         )
     
-    product = db.query(Product).filter(
-        Product.id == product_id,
-        Product.seller_id == seller.id,
-        Product.is_active == True
-    ).first()
+    product = (await db.execute(
+        _ACTIVE_SELLER_PRODUCT, {"product_id": product_id, "seller_id": seller.id}
+    )).scalar_one_or_none()
     
     if not product:
         raise HTTPException(
@@ -217,14 +296,10 @@ async def view_product_detail(
         )
     
     # Generate WhatsApp link
-    message = f"Hi! I'm interested in your product: {product.name}"
-    if product.price:
-        message += f" (priced at ${product.price})"
-    message += ". Is it still available?"
-    
-    whatsapp_link = whatsapp_service.generate_whatsapp_deep_link(
-        phone_number=seller.phone_number,
-        message=message
+    whatsapp_link = _cached_deep_link(
+        seller.phone_number,
+        product.name,
+        str(product.price) if product.price else None
     )
     
     return {
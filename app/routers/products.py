@@ -3,31 +3,55 @@ API endpoints for product management.
 Includes upload, removal with undo, and restoration.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Optional
 from uuid import UUID
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import uuid as uuid_module
-import shutil
 
 from app.database import get_db
 from app.models import Seller, Product, ActionLog
 from app.schemas import (
-    ProductCreate, ProductUpdate, ProductResponse,
+    ProductUpdate, ProductResponse,
     ProductUploadConfirmation, ProductRemoveRequest,
     ProductRestoreRequest, ProductListResponse,
-    SuccessResponse, ErrorResponse
+    SuccessResponse
 )
+from app.services.cache import get_cached_seller
+from app.services.http import media_client
 from app.services.logging import log_action
-from app.services.whatsapp import whatsapp_service
+from app.services.sellers import seller_exists
+from app.services.storage import (
+    CHUNK_SIZE, SNIFF_SIZE, UploadTooLargeError,
+    prepend_chunk, remove_file, save_stream, save_upload_file, sniff_image_type
+)
+from app.services.whatsapp import parse_caption, whatsapp_service
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
 # Upload settings
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", "10485760"))  # 10MB
+# Largest accepted request body: the image plus multipart framing and form fields
+MAX_REQUEST_SIZE = MAX_UPLOAD_SIZE + 64 * 1024
+INVALID_IMAGE_DETAIL = "Invalid file type. Allowed: JPEG, PNG, WebP"
+
+# Columns returned by the seller product list
+_PRODUCT_LIST_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    Product.currency,
+    Product.image_url,
+    Product.is_active,
+    Product.created_at,
+    Product.can_undo_until
+)
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -48,44 +72,33 @@ async def upload_product(
     This is the primary method for adding products via the mobile app.
     """
     # Validate seller exists
-    seller = db.query(Seller).filter(Seller.id == seller_id).first()
-    if not seller:
+    if not seller_exists(db, seller_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Seller not found"
         )
     
-    # Validate file type
-    allowed_types = ["image/jpeg", "image/jpg", "image/png", "image/webp"]
-    if image.content_type not in allowed_types:
+    # Validate file type from its magic bytes, not the client's content type
+    file_ext = sniff_image_type(await image.read(SNIFF_SIZE))
+    if not file_ext:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid file type. Allowed: {', '.join(allowed_types)}"
-        )
-    
-    # Validate file size
-    image.file.seek(0, 2)  # Seek to end
-    file_size = image.file.tell()
-    image.file.seek(0)  # Reset to beginning
-    
-    if file_size > MAX_UPLOAD_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File too large. Maximum size: {MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+            detail=INVALID_IMAGE_DETAIL
         )
+    await image.seek(0)
     
     # Generate unique filename
-    file_ext = os.path.splitext(image.filename)[1].lower()
-    if file_ext not in [".jpg", ".jpeg", ".png", ".webp"]:
-        file_ext = ".jpg"
-    
     unique_filename = f"{uuid_module.uuid4()}{file_ext}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
     
-    # Save file
+    # Stream file to disk, enforcing the size limit while writing
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        await save_upload_file(image, file_path, MAX_UPLOAD_SIZE)
+    except UploadTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size: {MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -108,10 +121,9 @@ async def upload_product(
     )
     
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    db.flush()
     
-    # Log product upload
+    # Log product upload (written in the same transaction)
     log_action(
         action_type=ActionLog.PRODUCT_UPLOADED,
         seller_id=seller_id,
@@ -121,14 +133,19 @@ async def upload_product(
             "price": price,
             "currency": currency,
             "image_filename": unique_filename
-        }
+        },
+        db=db
     )
     
+    db.commit()
+    db.refresh(product)
+    
     return product.to_dict()
 
 
 @router.post("/upload/whatsapp", response_model=ProductResponse)
 async def upload_product_via_whatsapp(
+    background_tasks: BackgroundTasks,
     phone_number: str = Form(...),
     image_url: str = Form(...),
     caption: Optional[str] = Form(None),
@@ -138,8 +155,8 @@ async def upload_product_via_whatsapp(
     Upload a product via WhatsApp message.
     Parses caption for product name and price.
     """
-    # Find or create seller
-    seller = db.query(Seller).filter(Seller.phone_number == phone_number).first()
+    # Find seller (cached - this runs for every inbound WhatsApp upload)
+    seller = get_cached_seller(db, phone_number)
     if not seller:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -148,45 +165,42 @@ async def upload_product_via_whatsapp(
     
     # Parse caption for product details
     # Expected format: "Product Name $50" or "Product Name - $50"
-    name = "Untitled Product"
-    price = None
+    name, price = parse_caption(caption)
     description = caption
     
-    if caption:
-        # Try to extract price
-        import re
-        price_match = re.search(r'[\$£€]?(\d+(?:\.\d{2})?)', caption)
-        if price_match:
-            price = float(price_match.group(1))
-            # Use text before price as name
-            name = caption[:price_match.start()].strip() or "Untitled Product"
-            # Remove common separators
-            name = re.sub(r'[-–—:]$', '', name).strip()
-        else:
-            name = caption[:50]  # First 50 chars as name
-    
     # Download image from WhatsApp
-    import httpx
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(image_url, timeout=30.0)
+        async with media_client.stream("GET", image_url) as response:
             response.raise_for_status()
             
-            # Save image
-            file_ext = ".jpg"  # Default
-            content_type = response.headers.get("content-type", "")
-            if "png" in content_type:
-                file_ext = ".png"
-            elif "webp" in content_type:
-                file_ext = ".webp"
+            # Identify the image from its first chunk before writing anything
+            chunks = response.aiter_bytes(CHUNK_SIZE)
+            first_chunk = await anext(chunks, b"")
+            file_ext = sniff_image_type(first_chunk[:SNIFF_SIZE])
+            if not file_ext:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=INVALID_IMAGE_DETAIL
+                )
             
             unique_filename = f"{uuid_module.uuid4()}{file_ext}"
             file_path = os.path.join(UPLOAD_DIR, unique_filename)
             
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            
-            local_image_url = f"/uploads/{unique_filename}"
+            # Stream the body straight to disk
+            await save_stream(
+                prepend_chunk(first_chunk, chunks),
+                file_path,
+                MAX_UPLOAD_SIZE
+            )
+        
+        local_image_url = f"/uploads/{unique_filename}"
+    except HTTPException:
+        raise
+    except UploadTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image too large. Maximum size: {MAX_UPLOAD_SIZE / 1024 / 1024}MB"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -206,12 +220,24 @@ async def upload_product_via_whatsapp(
     )
     
     db.add(product)
+    db.flush()
+    
+    # Log product upload (written in the same transaction)
+    log_action(
+        action_type=ActionLog.PRODUCT_UPLOADED,
+        seller_id=seller.id,
+        product_id=product.id,
+        action_data={"product_name": name, "price": price},
+        db=db
+    )
+    
     db.commit()
     db.refresh(product)
     
-    # Send confirmation message via WhatsApp
+    # Send confirmation message via WhatsApp after the response is sent
     price_str = f"${price:.2f}" if price else None
-    await whatsapp_service.send_upload_confirmation(
+    background_tasks.add_task(
+        whatsapp_service.send_upload_confirmation,
         to=phone_number,
         product_name=name,
         product_id=product.id,
@@ -219,45 +245,68 @@ async def upload_product_via_whatsapp(
         price=price_str
     )
     
-    return product.to_dict(include_seller=True)
+    data = product.to_dict()
+    data["seller"] = {
+        "id": str(seller.id),
+        "name": seller.name,
+        "phone_number": seller.phone_number
+    }
+    return data
 
 
 @router.post("/confirm", response_model=SuccessResponse)
 async def confirm_product_upload(
     confirmation: ProductUploadConfirmation,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
     Confirm or cancel a product upload via WhatsApp.
     ✅ to confirm, ❌ to cancel.
     """
-    product = db.query(Product).filter(Product.id == confirmation.product_id).first()
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
-    
-    seller = db.query(Seller).filter(Seller.id == product.seller_id).first()
-    
     if confirmation.confirmed:
-        # Activate product
-        product.is_active = True
-        db.commit()
+        # Activate product and fetch everything the reply needs in one
+        # UPDATE ... FROM sellers ... RETURNING (Core, so seller columns
+        # can be returned)
+        product = db.execute(
+            update(Product.__table__)
+            .where(
+                Product.id == confirmation.product_id,
+                Product.seller_id == Seller.id
+            )
+            .values(is_active=True)
+            .returning(
+                Product.id,
+                Product.name,
+                Product.seller_id,
+                Seller.phone_number,
+                Seller.catalog_slug
+            )
+        ).first()
+        
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
         
         # Log confirmation
         log_action(
             action_type=ActionLog.PRODUCT_CONFIRMED,
             seller_id=product.seller_id,
             product_id=product.id,
-            action_data={"product_name": product.name}
+            action_data={"product_name": product.name},
+            db=db
         )
         
-        # Send confirmation to seller
+        db.commit()
+        
+        # Send confirmation to seller after the response is sent
         from app.services.whatsapp import CATALOG_BASE_URL
-        catalog_url = f"{CATALOG_BASE_URL}/{seller.catalog_slug}"
-        await whatsapp_service.send_product_added_confirmation(
-            to=seller.phone_number,
+        catalog_url = f"{CATALOG_BASE_URL}/{product.catalog_slug}"
+        background_tasks.add_task(
+            whatsapp_service.send_product_added_confirmation,
+            to=product.phone_number,
             product_name=product.name,
             catalog_url=catalog_url
         )
@@ -268,23 +317,32 @@ async def confirm_product_upload(
             data={"product_id": str(product.id), "catalog_url": catalog_url}
         )
     else:
-        # Cancel - delete product and image
-        try:
-            if os.path.exists(product.image_path):
-                os.remove(product.image_path)
-        except Exception:
-            pass  # Ignore cleanup errors
+        # Cancel - delete product in one statement
+        product = db.execute(
+            delete(Product.__table__)
+            .where(Product.id == confirmation.product_id)
+            .returning(Product.image_path, Product.seller_id, Product.name)
+        ).first()
         
-        db.delete(product)
-        db.commit()
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
         
         # Log cancellation
         log_action(
             action_type=ActionLog.PRODUCT_CANCELLED,
-            seller_id=seller.id if seller else None,
-            action_data={"product_name": product.name}
+            seller_id=product.seller_id,
+            action_data={"product_name": product.name},
+            db=db
         )
         
+        db.commit()
+        
+        # Remove the image after the response is sent
+        background_tasks.add_task(remove_file, product.image_path)
+        
         return SuccessResponse(
             success=True,
             message="Product upload cancelled"
@@ -295,32 +353,79 @@ async def confirm_product_upload(
 async def get_seller_products(
     seller_id: UUID,
     include_inactive: bool = False,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db)
 ):
-    """Get all products for a seller."""
-    seller = db.query(Seller).filter(Seller.id == seller_id).first()
-    if not seller:
+    """
+    Get a page of products for a seller, newest first.
+    Totals are computed by the database alongside the page via window
+    aggregates, so only the requested rows are loaded. Rows are fetched
+    as plain columns and serialized with orjson, skipping ORM hydration
+    and response_model validation.
+    """
+    if not seller_exists(db, seller_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Seller not found"
         )
     
-    query = db.query(Product).filter(Product.seller_id == seller_id)
-    
+    filters = [Product.seller_id == seller_id]
     if not include_inactive:
-        query = query.filter(Product.is_active == True)
-    
-    products = query.order_by(Product.created_at.desc()).all()
+        filters.append(Product.is_active == True)
     
-    active_count = sum(1 for p in products if p.is_active)
-    removed_count = len(products) - active_count
-    
-    return ProductListResponse(
-        items=[p.to_dict() for p in products],
-        total=len(products),
-        active_count=active_count,
-        removed_count=removed_count
-    )
+    rows = db.execute(
+        select(
+            *_PRODUCT_LIST_COLUMNS,
+            func.count().over().label("total_n"),
+            func.count().filter(Product.is_active == True).over().label("active_n")
+        )
+        .where(*filters)
+        .order_by(Product.created_at.desc())
+        .offset(offset)
+        .limit(limit)
+    ).all()
+    
+    if rows:
+        total, active_count = rows[0].total_n, rows[0].active_n
+    elif offset:
+        # Page past the end - window totals are unavailable, count directly
+        total, active_count = db.execute(
+            select(
+                func.count(),
+                func.count().filter(Product.is_active == True)
+            ).where(*filters)
+        ).one()
+    else:
+        total = active_count = 0
+    
+    now = datetime.now(timezone.utc)
+    items = [
+        {
+            "id": row.id,
+            "name": row.name,
+            "description": row.description,
+            "price": float(row.price) if row.price else None,
+            "currency": row.currency,
+            "image_url": row.image_url,
+            "is_active": row.is_active,
+            "created_at": row.created_at,
+            "can_undo": (
+                not row.is_active
+                and row.can_undo_until is not None
+                and now < row.can_undo_until
+            ),
+            "seller": None
+        }
+        for row in rows
+    ]
+    
+    return ORJSONResponse({
+        "items": items,
+        "total": total,
+        "active_count": active_count,
+        "removed_count": total - active_count
+    })
 
 
 @router.get("/{product_id}", response_model=ProductResponse)
@@ -376,31 +481,38 @@ async def remove_products(
     Remove products (soft delete with undo window).
     Products are marked inactive and can be restored within 30 seconds.
     """
-    removed_count = 0
-    undo_window = datetime.utcnow() + timedelta(seconds=30)
-    
-    for product_id in request.product_ids:
-        product = db.query(Product).filter(
-            Product.id == product_id,
+    now = datetime.now(timezone.utc)
+    undo_window = now + timedelta(seconds=30)
+    
+    # Deactivate all matching products in one statement
+    removed = db.execute(
+        update(Product)
+        .where(
+            Product.id.in_(request.product_ids),
             Product.is_active == True
-        ).first()
-        
-        if product:
-            product.is_active = False
-            product.removed_at = datetime.utcnow()
-            product.can_undo_until = undo_window
-            removed_count += 1
-            
-            # Log removal
-            log_action(
-                action_type=ActionLog.PRODUCT_REMOVED,
-                seller_id=product.seller_id,
-                product_id=product.id,
-                action_data={
-                    "product_name": product.name,
-                    "undo_until": undo_window.isoformat()
-                }
-            )
+        )
+        .values(
+            is_active=False,
+            removed_at=now,
+            can_undo_until=undo_window
+        )
+        .returning(Product.id, Product.seller_id, Product.name),
+        execution_options={"synchronize_session": False}
+    ).all()
+    removed_count = len(removed)
+    
+    # Log removals (inserted as one batch on commit)
+    for product_id, seller_id, product_name in removed:
+        log_action(
+            action_type=ActionLog.PRODUCT_REMOVED,
+            seller_id=seller_id,
+            product_id=product_id,
+            action_data={
+                "product_name": product_name,
+                "undo_until": undo_window.isoformat()
+            },
+            db=db
+        )
     
     db.commit()
     
@@ -423,46 +535,60 @@ async def restore_product(
     """
     Restore a removed product (within 30-second window).
     """
-    product = db.query(Product).filter(
-        Product.id == request.product_id,
-        Product.is_active == False
-    ).first()
+    # Restore in one statement; the undo window is enforced by the database
+    product = db.execute(
+        update(Product)
+        .where(
+            Product.id == request.product_id,
+            Product.is_active == False,
+            Product.can_undo_until > func.now()
+        )
+        .values(
+            is_active=True,
+            removed_at=None,
+            can_undo_until=None
+        )
+        .returning(Product)
+    ).scalar_one_or_none()
     
     if not product:
+        # Nothing restored - tell an expired undo apart from a missing product
+        removed = db.query(
+            db.query(Product.id).filter(
+                Product.id == request.product_id,
+                Product.is_active == False
+            ).exists()
+        ).scalar()
+        if removed:
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Undo window has expired (30 seconds passed)"
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found or already active"
         )
     
-    # Check if undo is still allowed
-    if not product.can_undo():
-        raise HTTPException(
-            status_code=status.HTTP_410_GONE,
-            detail="Undo window has expired (30 seconds passed)"
-        )
-    
-    # Restore product
-    product.is_active = True
-    product.removed_at = None
-    product.can_undo_until = None
-    
-    db.commit()
-    db.refresh(product)
-    
     # Log restoration
     log_action(
         action_type=ActionLog.PRODUCT_RESTORED,
         seller_id=product.seller_id,
         product_id=product.id,
-        action_data={"product_name": product.name}
+        action_data={"product_name": product.name},
+        db=db
     )
     
-    return product.to_dict()
+    # Serialize before commit so the returned row is not reloaded
+    data = product.to_dict()
+    db.commit()
+    
+    return data
 
 
 @router.delete("/{product_id}", response_model=SuccessResponse)
 async def permanently_delete_product(
     product_id: UUID,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -476,16 +602,12 @@ async def permanently_delete_product(
             detail="Product not found"
         )
     
-    # Delete image file
-    try:
-        if os.path.exists(product.image_path):
-            os.remove(product.image_path)
-    except Exception:
-        pass  # Ignore cleanup errors
-    
     db.delete(product)
     db.commit()
     
+    # Delete image file after the response is sent
+    background_tasks.add_task(remove_file, product.image_path)
+    
     return SuccessResponse(
         success=True,
         message="Product permanently deleted"
@@ -2,29 +2,43 @@
 API endpoints for seller management.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func, inspect, or_, select, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, undefer
+from typing import Optional
 from uuid import UUID
-import secrets
-import string
+from datetime import datetime, timedelta, timezone
 
 from app.database import get_db
-from app.models import Seller, Product, ActionLog
+from app.models import Seller, Product, Interest, ActionLog
 from app.schemas import (
-    SellerCreate, SellerUpdate, SellerResponse,
+    SellerUpdate, SellerResponse,
     SellerRegisterRequest, SellerStatsResponse,
-    SuccessResponse, ErrorResponse
+    SuccessResponse
 )
+from app.services.cache import invalidate_seller
 from app.services.logging import log_action
+from app.services.sellers import SLUG_ATTEMPTS, generate_catalog_slug
 
 router = APIRouter(prefix="/sellers", tags=["Sellers"])
 
+# Columns the Seller mapper loads, named explicitly so RETURNING never asks
+# for the unmapped catalog_views (which unmigrated databases lack)
+_SELLER_RETURNING = [c for c in Seller.__table__.c if c.key != "catalog_views"]
 
-def generate_catalog_slug() -> str:
-    """Generate a unique catalog slug."""
-    # Generate a random 8-character alphanumeric slug
-    return ''.join(secrets.choice(string.ascii_lowercase + string.digits) for _ in range(8))
+# Whether sellers.catalog_views exists (see migrations/seller_catalog_views.sql).
+# Checked once per process on the first stats request.
+_has_catalog_views: Optional[bool] = None
+
+
+def has_catalog_views_column(db: Session) -> bool:
+    """Check whether the sellers.catalog_views counter has been migrated in."""
+    global _has_catalog_views
+    if _has_catalog_views is None:
+        columns = inspect(db.get_bind()).get_columns(Seller.__tablename__)
+        _has_catalog_views = any(c["name"] == "catalog_views" for c in columns)
+    return _has_catalog_views
 
 
 @router.post("/register", response_model=SellerResponse, status_code=status.HTTP_201_CREATED)
@@ -36,33 +50,50 @@ async def register_seller(
     Register a new seller via WhatsApp.
     Creates a dedicated Hustle chat for the seller.
     """
-    # Check if seller already exists
-    existing = db.query(Seller).filter(Seller.phone_number == request.phone_number).first()
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Seller already registered with this phone number"
-        )
-    
-    # Generate unique catalog slug
-    slug = generate_catalog_slug()
-    while db.query(Seller).filter(Seller.catalog_slug == slug).first():
+    # Insert optimistically; any unique conflict (phone, chat or slug)
+    # returns no row instead of raising
+    seller = None
+    for _ in range(SLUG_ATTEMPTS):
         slug = generate_catalog_slug()
+        seller = db.scalars(
+            select(Seller).from_statement(
+                insert(Seller)
+                .values(
+                    phone_number=request.phone_number,
+                    name=request.name,
+                    whatsapp_chat_id=request.whatsapp_chat_id,
+                    catalog_slug=slug,
+                    is_active=True
+                )
+                .on_conflict_do_nothing()
+                .returning(*_SELLER_RETURNING)
+            )
+        ).one_or_none()
+        if seller:
+            break
+        
+        # Conflict - only retry if it was the slug that collided
+        taken = Seller.phone_number == request.phone_number
+        if request.whatsapp_chat_id:
+            taken = or_(taken, Seller.whatsapp_chat_id == request.whatsapp_chat_id)
+        existing = db.query(Seller.phone_number).filter(taken).first()
+        if existing:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=(
+                    "Seller already registered with this phone number"
+                    if existing.phone_number == request.phone_number
+                    else "Seller already registered with this WhatsApp chat"
+                )
+            )
     
-    # Create seller
-    seller = Seller(
-        phone_number=request.phone_number,
-        name=request.name,
-        whatsapp_chat_id=request.whatsapp_chat_id,
-        catalog_slug=slug,
-        is_active=True
-    )
-    
-    db.add(seller)
-    db.commit()
-    db.refresh(seller)
+    if not seller:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Could not generate a unique catalog link. Please try again."
+        )
     
-    # Log registration
+    # Log registration (written in the same transaction)
     log_action(
         action_type=ActionLog.SELLER_REGISTERED,
         seller_id=seller.id,
@@ -70,9 +101,14 @@ async def register_seller(
             "phone_number": seller.phone_number,
             "name": seller.name,
             "catalog_slug": slug
-        }
+        },
+        db=db
     )
     
+    db.commit()
+    db.refresh(seller)
+    invalidate_seller(seller.phone_number)
+    
     return seller.to_dict()
 
 
@@ -82,7 +118,9 @@ async def get_seller_by_phone(
     db: Session = Depends(get_db)
 ):
     """Get seller by phone number."""
-    seller = db.query(Seller).filter(Seller.phone_number == phone_number).first()
+    seller = db.query(Seller).options(undefer(Seller.product_count)).filter(
+        Seller.phone_number == phone_number
+    ).first()
     if not seller:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -97,7 +135,9 @@ async def get_seller(
     db: Session = Depends(get_db)
 ):
     """Get seller by ID."""
-    seller = db.query(Seller).filter(Seller.id == seller_id).first()
+    seller = db.query(Seller).options(undefer(Seller.product_count)).filter(
+        Seller.id == seller_id
+    ).first()
     if not seller:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -127,6 +167,7 @@ async def update_seller(
     
     db.commit()
     db.refresh(seller)
+    invalidate_seller(seller.phone_number)
     
     return seller.to_dict()
 
@@ -146,6 +187,7 @@ async def delete_seller(
     
     db.delete(seller)
     db.commit()
+    invalidate_seller(seller.phone_number)
     
     return SuccessResponse(
         success=True,
@@ -158,41 +200,58 @@ async def get_seller_stats(
     seller_id: UUID,
     db: Session = Depends(get_db)
 ):
-    """Get seller statistics."""
-    seller = db.query(Seller).filter(Seller.id == seller_id).first()
-    if not seller:
+    """
+    Get seller statistics.
+    All counts are computed in a single round-trip.
+    """
+    recent_date = datetime.now(timezone.utc) - timedelta(days=7)
+    
+    product_stats = select(
+        func.count().label("total"),
+        func.count().filter(Product.is_active == True).label("active")
+    ).where(Product.seller_id == seller_id).subquery()
+    
+    # Interests on the seller's products, total and last 7 days
+    interest_stats = select(
+        func.count().label("total"),
+        func.count().filter(Interest.created_at >= recent_date).label("recent")
+    ).select_from(Interest).join(Product).where(
+        Product.seller_id == seller_id
+    ).subquery()
+    
+    # Catalog views from the trigger-maintained counter; databases that
+    # have not been migrated yet count them from action logs
+    if has_catalog_views_column(db):
+        catalog_views = Seller.__table__.c.catalog_views
+    else:
+        catalog_views = select(func.count()).select_from(ActionLog).where(
+            ActionLog.seller_id == seller_id,
+            ActionLog.action_type == ActionLog.CATALOG_VIEWED
+        ).scalar_subquery()
+    
+    stats = db.execute(
+        select(
+            product_stats.c.total,
+            product_stats.c.active,
+            interest_stats.c.total,
+            interest_stats.c.recent,
+            catalog_views
+        )
+        .select_from(Seller)
+        .join(product_stats, true())
+        .join(interest_stats, true())
+        .where(Seller.id == seller_id)
+    ).first()
+    
+    if not stats:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Seller not found"
         )
     
-    total_products = db.query(Product).filter(Product.seller_id == seller_id).count()
-    active_products = db.query(Product).filter(
-        Product.seller_id == seller_id,
-        Product.is_active == True
-    ).count()
+    total_products, active_products, total_interests, recent_interests, catalog_views = stats
     removed_products = total_products - active_products
     
-    # Count total interests for seller's products
-    from app.models import Interest
-    total_interests = db.query(Interest).join(Product).filter(
-        Product.seller_id == seller_id
-    ).count()
-    
-    # Recent interests (last 7 days)
-    from datetime import datetime, timedelta
-    recent_date = datetime.utcnow() - timedelta(days=7)
-    recent_interests = db.query(Interest).join(Product).filter(
-        Product.seller_id == seller_id,
-        Interest.created_at >= recent_date
-    ).count()
-    
-    # Catalog views (from action logs)
-    catalog_views = db.query(ActionLog).filter(
-        ActionLog.seller_id == seller_id,
-        ActionLog.action_type == ActionLog.CATALOG_VIEWED
-    ).count()
-    
     return SellerStatsResponse(
         total_products=total_products,
         active_products=active_products,
@@ -209,8 +268,8 @@ async def get_catalog_link(
     db: Session = Depends(get_db)
 ):
     """Get the private catalog link for a seller."""
-    seller = db.query(Seller).filter(Seller.id == seller_id).first()
-    if not seller:
+    catalog_slug = db.query(Seller.catalog_slug).filter(Seller.id == seller_id).scalar()
+    if not catalog_slug:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Seller not found"
@@ -218,9 +277,9 @@ async def get_catalog_link(
     
     from app.services.whatsapp import CATALOG_BASE_URL
     
-    catalog_url = f"{CATALOG_BASE_URL}/{seller.catalog_slug}"
+    catalog_url = f"{CATALOG_BASE_URL}/{catalog_slug}"
     
     return {
         "catalog_url": catalog_url,
-        "catalog_slug": seller.catalog_slug
+        "catalog_slug": catalog_slug
     }
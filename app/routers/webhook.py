@@ -2,16 +2,25 @@
 WhatsApp webhook endpoints for receiving messages and events.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Query, status
-from sqlalchemy.orm import Session
-import json
-import hmac
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Query, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import hashlib
+import hmac
 import os
+import re
+
+import orjson
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import Seller, Product, ActionLog
-from app.services.whatsapp import whatsapp_service
+from app.services.cache import get_cached_seller_async, invalidate_seller
+from app.services.http import media_client
+from app.services.sellers import SLUG_ATTEMPTS, generate_catalog_slug
+from app.services.storage import CHUNK_SIZE, remove_file, save_stream
+from app.services.whatsapp import parse_caption, whatsapp_service
 from app.services.logging import log_action
 
 router = APIRouter(prefix="/webhook", tags=["Webhook"])
@@ -19,6 +28,14 @@ router = APIRouter(prefix="/webhook", tags=["Webhook"])
 # Webhook verification token
 VERIFY_TOKEN = os.getenv("WHATSAPP_WEBHOOK_VERIFY_TOKEN", "hustle-webhook-token")
 
+# App secret used by Meta to sign webhook payloads (X-Hub-Signature-256).
+# Signature checks are skipped when it is not configured.
+APP_SECRET = os.getenv("WHATSAPP_APP_SECRET", "").encode()
+
+# Catalog link keywords, matched anywhere in the text in a single pass
+# (exact-match commands are in _TEXT_COMMANDS at the end of the module)
+_LINK_RE = re.compile(r"link|catalog|my shop|my store")
+
 
 @router.get("/whatsapp")
 async def verify_webhook(
@@ -43,15 +60,26 @@ async def verify_webhook(
 @router.post("/whatsapp")
 async def receive_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Receive WhatsApp webhook events.
     Handles incoming messages, button clicks, and status updates.
     """
+    body = await request.body()
+    
+    if APP_SECRET and not is_valid_signature(
+        body, request.headers.get("x-hub-signature-256", "")
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid signature"
+        )
+    
     try:
-        payload = await request.json()
-    except Exception:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid JSON payload"
@@ -80,31 +108,36 @@ async def receive_webhook(
         )
     
     elif message_type == "interactive":
-        await handle_interactive_message(phone_number, parsed, db)
+        await handle_interactive_message(phone_number, parsed, background_tasks, db)
     
     return {"status": "processed"}
 
 
+def is_valid_signature(body: bytes, signature_header: str) -> bool:
+    """Check a "sha256=<hex>" webhook signature against the raw body."""
+    expected = b"sha256=" + hmac.new(APP_SECRET, body, hashlib.sha256).hexdigest().encode()
+    # Compare as bytes: compare_digest rejects non-ASCII str with TypeError
+    return hmac.compare_digest(
+        expected, signature_header.encode("utf-8", "surrogateescape")
+    )
+
+
 async def handle_text_message(
     phone_number: str,
     text: str,
-    db: Session
+    db: AsyncSession
 ):
     """Handle incoming text message."""
     text_lower = text.lower().strip()
     
-    # Check for registration command
-    if text_lower in ["start", "hello", "hi", "register", "signup"]:
-        await handle_registration(phone_number, db)
-        return
-    
-    # Check for help command
-    if text_lower in ["help", "?", "how", "guide"]:
-        await send_help_message(phone_number)
+    # Check for registration / help commands
+    command = _TEXT_COMMANDS.get(text_lower)
+    if command:
+        await command(phone_number, db)
         return
     
     # Check for catalog link request
-    if any(word in text_lower for word in ["link", "catalog", "my shop", "my store"]):
+    if _LINK_RE.search(text_lower):
         await send_catalog_link(phone_number, db)
         return
     
@@ -126,18 +159,17 @@ async def handle_image_message(
     phone_number: str,
     image_data: dict,
     caption: str,
-    db: Session
+    db: AsyncSession
 ):
     """Handle incoming image message (product upload)."""
-    # Find or create seller
-    seller = db.query(Seller).filter(Seller.phone_number == phone_number).first()
+    image_id = image_data.get("id")
     
-    if not seller:
-        # Auto-register if not exists
-        seller = await auto_register_seller(phone_number, db)
+    # Find or create seller while the image URL is fetched from WhatsApp
+    seller, image_url = await asyncio.gather(
+        get_or_register_seller(phone_number, db),
+        get_media_url(image_id)
+    )
     
-    # Get image URL from WhatsApp
-    image_id = image_data.get("id")
     if not image_id:
         await whatsapp_service.send_text_message(
             to=phone_number,
@@ -145,9 +177,6 @@ async def handle_image_message(
         )
         return
     
-    # Download image URL from WhatsApp API
-    image_url = await get_media_url(image_id)
-    
     if not image_url:
         await whatsapp_service.send_text_message(
             to=phone_number,
@@ -156,29 +185,16 @@ async def handle_image_message(
         return
     
     # Create product (inactive until confirmed)
-    from app.routers.products import UPLOAD_DIR, MAX_UPLOAD_SIZE
+    from app.routers.products import MAX_UPLOAD_SIZE, UPLOAD_DIR
     import uuid as uuid_module
-    import httpx
     import os
     
     # Parse caption for product details
-    import re
-    name = "Untitled Product"
-    price = None
-    
-    if caption:
-        price_match = re.search(r'[\$£€]?(\d+(?:\.\d{2})?)', caption)
-        if price_match:
-            price = float(price_match.group(1))
-            name = caption[:price_match.start()].strip() or "Untitled Product"
-            name = re.sub(r'[-–—:]$', '', name).strip()
-        else:
-            name = caption[:50]
+    name, price = parse_caption(caption)
     
     # Download and save image
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(image_url, timeout=30.0)
+        async with media_client.stream("GET", image_url) as response:
             response.raise_for_status()
             
             file_ext = ".jpg"
@@ -191,10 +207,14 @@ async def handle_image_message(
             unique_filename = f"{uuid_module.uuid4()}{file_ext}"
             file_path = os.path.join(UPLOAD_DIR, unique_filename)
             
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            
-            local_image_url = f"/uploads/{unique_filename}"
+            # Stream the body straight to disk
+            await save_stream(
+                response.aiter_bytes(CHUNK_SIZE),
+                file_path,
+                MAX_UPLOAD_SIZE
+            )
+        
+        local_image_url = f"/uploads/{unique_filename}"
     except Exception as e:
         await whatsapp_service.send_text_message(
             to=phone_number,
@@ -215,8 +235,7 @@ async def handle_image_message(
     )
     
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.commit()
     
     # Log upload
     log_action(
@@ -240,7 +259,8 @@ async def handle_image_message(
 async def handle_interactive_message(
     phone_number: str,
     parsed: dict,
-    db: Session
+    background_tasks: BackgroundTasks,
+    db: AsyncSession
 ):
     """Handle interactive message (button clicks)."""
     button_reply = parsed.get("button_reply", {})
@@ -249,18 +269,19 @@ async def handle_interactive_message(
     # Handle product confirmation buttons
     if button_id.startswith("confirm_add_"):
         product_id = button_id.replace("confirm_add_", "")
-        await confirm_product(product_id, phone_number, True, db)
+        await confirm_product(product_id, phone_number, True, background_tasks, db)
     
     elif button_id.startswith("cancel_add_"):
         product_id = button_id.replace("cancel_add_", "")
-        await confirm_product(product_id, phone_number, False, db)
+        await confirm_product(product_id, phone_number, False, background_tasks, db)
 
 
 async def confirm_product(
     product_id: str,
     phone_number: str,
     confirmed: bool,
-    db: Session
+    background_tasks: BackgroundTasks,
+    db: AsyncSession
 ):
     """Handle product confirmation button click."""
     from uuid import UUID
@@ -275,7 +296,25 @@ async def confirm_product(
         )
         return
     
-    product = db.query(Product).filter(Product.id == product_uuid).first()
+    if confirmed:
+        # Activate product and fetch what the reply needs in one
+        # UPDATE ... FROM sellers ... RETURNING
+        product = (await db.execute(
+            update(Product.__table__)
+            .where(
+                Product.id == product_uuid,
+                Product.seller_id == Seller.id
+            )
+            .values(is_active=True)
+            .returning(Product.name, Product.seller_id, Seller.catalog_slug)
+        )).first()
+    else:
+        # Cancel - delete product in one statement
+        product = (await db.execute(
+            delete(Product.__table__)
+            .where(Product.id == product_uuid)
+            .returning(Product.name, Product.seller_id, Product.image_path)
+        )).first()
     
     if not product:
         await whatsapp_service.send_text_message(
@@ -284,42 +323,30 @@ async def confirm_product(
         )
         return
     
-    seller = db.query(Seller).filter(Seller.id == product.seller_id).first()
+    await db.commit()
     
     if confirmed:
-        # Activate product
-        product.is_active = True
-        db.commit()
-        
         log_action(
             action_type=ActionLog.PRODUCT_CONFIRMED,
             seller_id=product.seller_id,
-            product_id=product.id,
+            product_id=product_uuid,
             action_data={"product_name": product.name}
         )
         
         # Send confirmation
-        catalog_url = f"{CATALOG_BASE_URL}/{seller.catalog_slug}"
+        catalog_url = f"{CATALOG_BASE_URL}/{product.catalog_slug}"
         await whatsapp_service.send_product_added_confirmation(
             to=phone_number,
             product_name=product.name,
             catalog_url=catalog_url
         )
     else:
-        # Cancel - delete product
-        import os
-        try:
-            if os.path.exists(product.image_path):
-                os.remove(product.image_path)
-        except Exception:
-            pass
-        
-        db.delete(product)
-        db.commit()
+        # Remove the image file off the event loop, after the response
+        background_tasks.add_task(remove_file, product.image_path)
         
         log_action(
             action_type=ActionLog.PRODUCT_CANCELLED,
-            seller_id=seller.id if seller else None,
+            seller_id=product.seller_id,
             action_data={"product_name": product.name}
         )
         
@@ -329,9 +356,17 @@ async def confirm_product(
         )
 
 
-async def handle_registration(phone_number: str, db: Session):
+async def get_or_register_seller(phone_number: str, db: AsyncSession):
+    """Find a seller by phone number, auto-registering them if needed."""
+    seller = await get_cached_seller_async(db, phone_number)
+    if not seller:
+        seller = await auto_register_seller(phone_number, db)
+    return seller
+
+
+async def handle_registration(phone_number: str, db: AsyncSession):
     """Handle seller registration."""
-    seller = db.query(Seller).filter(Seller.phone_number == phone_number).first()
+    seller = await get_cached_seller_async(db, phone_number)
     
     if seller:
         # Already registered
@@ -353,30 +388,36 @@ Send me a photo to add a new product! 📸"""
         seller = await auto_register_seller(phone_number, db)
 
 
-async def auto_register_seller(phone_number: str, db: Session) -> Seller:
+async def auto_register_seller(phone_number: str, db: AsyncSession) -> Seller:
     """Auto-register a new seller."""
-    import secrets
-    import string
     from app.services.whatsapp import CATALOG_BASE_URL
     
-    # Generate unique slug
-    def generate_slug():
-        return ''.join(secrets.choice(string.ascii_lowercase + string.digits) for _ in range(8))
-    
-    slug = generate_slug()
-    while db.query(Seller).filter(Seller.catalog_slug == slug).first():
-        slug = generate_slug()
-    
-    seller = Seller(
-        phone_number=phone_number,
-        catalog_slug=slug,
-        whatsapp_chat_id=phone_number,
-        is_active=True
-    )
-    
-    db.add(seller)
-    db.commit()
-    db.refresh(seller)
+    # Rely on the unique indexes instead of checking the slug first;
+    # a collision just means another attempt with a fresh slug
+    for attempt in range(SLUG_ATTEMPTS):
+        slug = generate_catalog_slug()
+        seller = Seller(
+            phone_number=phone_number,
+            catalog_slug=slug,
+            whatsapp_chat_id=phone_number,
+            is_active=True
+        )
+        db.add(seller)
+        try:
+            await db.commit()
+            break
+        except IntegrityError:
+            await db.rollback()
+            # Registered meanwhile by another message from the same number
+            existing = (await db.execute(
+                select(Seller).where(Seller.phone_number == phone_number)
+            )).scalar_one_or_none()
+            if existing:
+                return existing
+            if attempt == SLUG_ATTEMPTS - 1:
+                raise
+    
+    invalidate_seller(phone_number)
     
     # Log registration
     log_action(
@@ -396,6 +437,11 @@ async def auto_register_seller(phone_number: str, db: Session) -> Seller:
     return seller
 
 
+async def handle_help(phone_number: str, db: AsyncSession):
+    """Handle a help request."""
+    await send_help_message(phone_number)
+
+
 async def send_help_message(phone_number: str):
     """Send help message."""
     await whatsapp_service.send_text_message(
@@ -426,9 +472,9 @@ Need more help? Contact support@hustle.app"""
     )
 
 
-async def send_catalog_link(phone_number: str, db: Session):
+async def send_catalog_link(phone_number: str, db: AsyncSession):
     """Send catalog link to seller."""
-    seller = db.query(Seller).filter(Seller.phone_number == phone_number).first()
+    seller = await get_cached_seller_async(db, phone_number)
     
     if not seller:
         await whatsapp_service.send_text_message(
@@ -460,9 +506,11 @@ Your catalog updates automatically when you add/remove products."""
 
 async def get_media_url(media_id: str) -> str:
     """Get media URL from WhatsApp API."""
-    import httpx
     import os
     
+    if not media_id:
+        return ""
+    
     api_token = os.getenv("WHATSAPP_API_TOKEN", "")
     api_version = "v18.0"
     base_url = f"https://graph.facebook.com/{api_version}"
@@ -470,11 +518,24 @@ async def get_media_url(media_id: str) -> str:
     url = f"{base_url}/{media_id}"
     headers = {"Authorization": f"Bearer {api_token}"}
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("url", "")
-        except Exception:
-            return ""
+    try:
+        response = await media_client.get(url, headers=headers)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        return data.get("url", "")
+    except Exception:
+        return ""
+
+
+# Exact-match text commands -> handler(phone_number, db). Defined after
+# the handlers; handle_text_message looks it up at call time.
+_TEXT_COMMANDS = {
+    **dict.fromkeys(
+        ("start", "hello", "hi", "register", "signup"),
+        handle_registration
+    ),
+    **dict.fromkeys(
+        ("help", "?", "how", "guide"),
+        handle_help
+    ),
+}
@@ -2,9 +2,8 @@
 Pydantic schemas for request/response validation.
 """
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional, List
-from decimal import Decimal
 from datetime import datetime
 from uuid import UUID
 
@@ -39,8 +38,7 @@ class SellerResponse(BaseModel):
     created_at: datetime
     product_count: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class SellerRegisterRequest(BaseModel):
@@ -102,8 +100,7 @@ class ProductResponse(BaseModel):
     can_undo: bool
     seller: Optional[dict] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ProductUploadConfirmation(BaseModel):
@@ -153,8 +150,7 @@ class InterestResponse(BaseModel):
     created_at: datetime
     whatsapp_link: Optional[str] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ============== Catalog Schemas ==============
@@ -170,8 +166,7 @@ class CatalogProductResponse(BaseModel):
     seller_name: Optional[str]
     whatsapp_link: str
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class CatalogResponse(BaseModel):
@@ -191,11 +186,10 @@ class ActionLogResponse(BaseModel):
     seller_id: Optional[UUID]
     product_id: Optional[UUID]
     interest_id: Optional[UUID]
-    action_data: Optional[str]
+    action_data: Optional[dict]
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ActionLogListResponse(BaseModel):
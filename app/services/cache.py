@@ -0,0 +1,74 @@
+"""
+In-process caches for hot lookups.
+Entries hold plain values (ids and strings), never ORM instances,
+so no session state is shared between requests.
+"""
+
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Seller
+
+
+class CachedSeller(NamedTuple):
+    """Seller fields needed by the WhatsApp paths."""
+    id: UUID
+    name: Optional[str]
+    phone_number: str
+    catalog_slug: str
+
+
+# phone_number -> CachedSeller. The short TTL bounds staleness across
+# worker processes, which each hold their own copy.
+_seller_cache = TTLCache(maxsize=10_000, ttl=60)
+
+
+def get_cached_seller(db: Session, phone_number: str) -> Optional[CachedSeller]:
+    """
+    Look up a seller by phone number, hitting the database only on a miss.
+    Unknown numbers are not cached, so a new registration is seen immediately.
+    """
+    seller = _seller_cache.get(phone_number)
+    if seller is not None:
+        return seller
+    
+    row = db.query(
+        Seller.id, Seller.name, Seller.phone_number, Seller.catalog_slug
+    ).filter(Seller.phone_number == phone_number).first()
+    if row is None:
+        return None
+    
+    seller = CachedSeller(*row)
+    _seller_cache[phone_number] = seller
+    return seller
+
+
+async def get_cached_seller_async(
+    db: AsyncSession,
+    phone_number: str
+) -> Optional[CachedSeller]:
+    """Async variant of get_cached_seller, sharing the same cache."""
+    seller = _seller_cache.get(phone_number)
+    if seller is not None:
+        return seller
+    
+    row = (await db.execute(
+        select(Seller.id, Seller.name, Seller.phone_number, Seller.catalog_slug)
+        .where(Seller.phone_number == phone_number)
+    )).first()
+    if row is None:
+        return None
+    
+    seller = CachedSeller(*row)
+    _seller_cache[phone_number] = seller
+    return seller
+
+
+def invalidate_seller(phone_number: str) -> None:
+    """Drop a cached seller after it is created, changed or deleted."""
+    _seller_cache.pop(phone_number, None)
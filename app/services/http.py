@@ -0,0 +1,19 @@
+"""
+Shared HTTP client for outbound requests.
+A single pooled client is reused so connections stay alive between calls.
+"""
+
+import httpx
+
+# Media downloads (WhatsApp images, etc.). HTTP/2 lets concurrent
+# downloads from the same host share one TLS connection.
+media_client = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+)
+
+
+async def close_http_clients() -> None:
+    """Close shared HTTP clients on shutdown."""
+    await media_client.aclose()
@@ -3,14 +3,29 @@ Logging service for comprehensive action tracking.
 Used for dispute resolution and system monitoring.
 """
 
-import json
-from typing import Optional, Any, Dict
+import asyncio
+from typing import Optional, Any, Dict, List
 from uuid import UUID
 from datetime import datetime
 
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
 from app.database import SessionLocal
 from app.models import ActionLog
 
+# Session.info key holding log rows waiting for the next commit
+LOG_BUFFER_KEY = "_log_buffer"
+
+# Background writer batching
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL = 0.1  # seconds
+
+# Set while the background writer runs (see start_log_worker)
+_log_queue: Optional[asyncio.Queue] = None
+_log_loop: Optional[asyncio.AbstractEventLoop] = None
+_log_worker_task: Optional[asyncio.Task] = None
+
 
 def log_action(
     action_type: str,
@@ -20,47 +35,150 @@ def log_action(
     action_data: Optional[Dict[str, Any]] = None,
     ip_address: Optional[str] = None,
     user_agent: Optional[str] = None,
-    whatsapp_message_id: Optional[str] = None
-) -> ActionLog:
+    whatsapp_message_id: Optional[str] = None,
+    db: Optional[Session] = None
+) -> None:
     """
-    Log an action to the database.
+    Log an action to the database without blocking the caller.
+    
+    When a session is passed, the entry is buffered on it and inserted in
+    the same transaction as the caller's changes when that session commits.
+    Otherwise the entry is queued for the background log writer, or written
+    immediately if the writer is not running (e.g. scripts, tests).
+    Safe to call from the event loop or from worker threads.
     
     Args:
         action_type: Type of action (from ActionLog constants)
         seller_id: Optional seller UUID
         product_id: Optional product UUID
         interest_id: Optional interest UUID
-        action_data: Optional dict of additional data (will be JSON serialized)
+        action_data: Optional dict of additional data (stored as JSONB)
         ip_address: Optional IP address
         user_agent: Optional user agent string
         whatsapp_message_id: Optional WhatsApp message ID
+        db: Optional request session to buffer the entry on
+    """
+    row = {
+        "action_type": action_type,
+        "seller_id": seller_id,
+        "product_id": product_id,
+        "interest_id": interest_id,
+        "action_data": action_data or None,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "whatsapp_message_id": whatsapp_message_id
+    }
     
-    Returns:
-        Created ActionLog instance
+    if db is not None:
+        db.info.setdefault(LOG_BUFFER_KEY, []).append(row)
+        return
+    
+    if _log_queue is not None:
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is _log_loop:
+            _log_queue.put_nowait(row)
+        else:
+            # Called from a worker thread (sync endpoint, threadpool task)
+            _log_loop.call_soon_threadsafe(_log_queue.put_nowait, row)
+        return
+    
+    _write_log_rows([row])
+
+
+def _write_log_rows(rows: List[Dict[str, Any]]) -> None:
+    """
+    Insert log rows in one transaction. Errors are reported, never raised.
+    If the batch fails (e.g. a referenced row was deleted before the flush),
+    rows are retried one by one so only the bad ones are dropped.
     """
     db = SessionLocal()
     try:
-        log_entry = ActionLog(
-            action_type=action_type,
-            seller_id=seller_id,
-            product_id=product_id,
-            interest_id=interest_id,
-            action_data=json.dumps(action_data) if action_data else None,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            whatsapp_message_id=whatsapp_message_id
-        )
-        db.add(log_entry)
+        # Plain dicts through Core, no ORM objects: every row has the same
+        # keys, so the batch goes out as one multi-row INSERT
+        db.execute(insert(ActionLog.__table__), rows)
         db.commit()
-        db.refresh(log_entry)
-        return log_entry
+        return
     except Exception as e:
         db.rollback()
-        # Don't raise - logging should not break main flow
-        print(f"Failed to log action: {e}")
-        return None
+        error = e
     finally:
         db.close()
+    
+    if len(rows) > 1:
+        for row in rows:
+            _write_log_rows([row])
+    else:
+        # Don't raise - logging should not break main flow
+        print(f"Failed to log action: {error}")
+
+
+async def _log_worker() -> None:
+    """
+    Drain the log queue, writing up to LOG_BATCH_SIZE rows at a time.
+    A batch is written once it is full or LOG_FLUSH_INTERVAL has passed
+    since its first row. A None item flushes what is pending and stops.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        row = await _log_queue.get()
+        if row is None:
+            break
+        batch = [row]
+        deadline = loop.time() + LOG_FLUSH_INTERVAL
+        while len(batch) < LOG_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(_log_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                stopping = True
+                break
+            batch.append(row)
+        await asyncio.to_thread(_write_log_rows, batch)
+
+
+def start_log_worker() -> None:
+    """Start the background log writer on the running event loop."""
+    global _log_queue, _log_loop, _log_worker_task
+    if _log_worker_task is not None:
+        return
+    _log_loop = asyncio.get_running_loop()
+    _log_queue = asyncio.Queue()
+    _log_worker_task = _log_loop.create_task(_log_worker())
+
+
+async def stop_log_worker() -> None:
+    """Flush queued log rows and stop the background log writer."""
+    global _log_queue, _log_loop, _log_worker_task
+    if _log_worker_task is None:
+        return
+    _log_queue.put_nowait(None)
+    await _log_worker_task
+    _log_queue = _log_loop = _log_worker_task = None
+
+
+@event.listens_for(Session, "before_commit")
+def _flush_log_buffer(session: Session) -> None:
+    """Insert buffered log entries in one batch before the session commits."""
+    buffered = session.info.pop(LOG_BUFFER_KEY, None)
+    if not buffered:
+        return
+    # Flush pending objects first so logged rows can reference them
+    session.flush()
+    session.execute(insert(ActionLog.__table__), buffered)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_log_buffer(session: Session) -> None:
+    """Drop buffered log entries when their transaction is rolled back."""
+    session.info.pop(LOG_BUFFER_KEY, None)
 
 
 def get_seller_logs(
@@ -144,7 +262,7 @@ def log_error(
     seller_id: Optional[UUID] = None,
     product_id: Optional[UUID] = None,
     details: Optional[Dict[str, Any]] = None
-) -> ActionLog:
+) -> None:
     """
     Log an error occurrence.
     
@@ -153,15 +271,12 @@ def log_error(
         seller_id: Optional seller UUID
         product_id: Optional product UUID
         details: Optional error details
-    
-    Returns:
-        Created ActionLog instance
     """
     action_data = {"error": error_message}
     if details:
         action_data.update(details)
     
-    return log_action(
+    log_action(
         action_type=ActionLog.ERROR_OCCURRED,
         seller_id=seller_id,
         product_id=product_id,
@@ -0,0 +1,27 @@
+"""
+Seller helpers shared by the REST and WhatsApp routers.
+"""
+
+import base64
+import secrets
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.models import Seller
+
+# Catalog slug candidates tried before giving up on registration
+SLUG_ATTEMPTS = 3
+
+
+def generate_catalog_slug() -> str:
+    """Generate a unique catalog slug."""
+    # 5 random bytes -> 8 base32 characters (a-z, 2-7), no padding
+    return base64.b32encode(secrets.token_bytes(5)).decode().lower()
+
+
+def seller_exists(db: Session, seller_id: UUID) -> bool:
+    """Check that a seller exists without loading the row."""
+    return db.query(
+        db.query(Seller.id).filter(Seller.id == seller_id).exists()
+    ).scalar()
@@ -0,0 +1,128 @@
+"""
+File storage service for product images.
+Streams uploads and downloads to disk in chunks without blocking the event loop.
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+
+# Chunk size for streamed reads and writes
+CHUNK_SIZE = 64 * 1024
+
+# Bytes needed to identify a supported image format
+SNIFF_SIZE = 12
+
+# Leading magic bytes -> file extension
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+)
+
+
+class UploadTooLargeError(Exception):
+    """Raised when a file exceeds the allowed upload size."""
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Identify an image from its first bytes.
+
+    Args:
+        head: At least the first SNIFF_SIZE bytes of the file
+
+    Returns:
+        File extension (".jpg", ".png" or ".webp"), or None if unsupported
+    """
+    for signature, file_ext in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return file_ext
+    # WebP: "RIFF" <4-byte size> "WEBP"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+async def save_stream(
+    chunks: AsyncIterator[bytes],
+    file_path: str,
+    max_size: Optional[int] = None
+) -> int:
+    """
+    Write a stream of chunks to disk without buffering the whole file.
+    Data goes to a ".part" file that is fsynced and renamed into place, so
+    file_path never exists half-written.
+
+    Args:
+        chunks: Async iterator of file data
+        file_path: Destination path
+        max_size: Optional maximum allowed size in bytes
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        UploadTooLargeError: If the stream is larger than max_size.
+            The partially written file is removed.
+    """
+    tmp_path = f"{file_path}.part"
+    bytes_written = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as buffer:
+            async for chunk in chunks:
+                bytes_written += len(chunk)
+                if max_size is not None and bytes_written > max_size:
+                    raise UploadTooLargeError(f"File exceeds {max_size} bytes")
+                await buffer.write(chunk)
+            await buffer.flush()
+            await asyncio.to_thread(os.fsync, buffer.fileno())
+        await aiofiles.os.replace(tmp_path, file_path)
+    except BaseException:
+        remove_file(tmp_path)
+        raise
+    return bytes_written
+
+
+async def prepend_chunk(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Yield an already-read chunk followed by the rest of a stream."""
+    if first:
+        yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def _iter_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    """Read an uploaded file in CHUNK_SIZE pieces."""
+    while chunk := await upload.read(CHUNK_SIZE):
+        yield chunk
+
+
+async def save_upload_file(upload: UploadFile, file_path: str, max_size: int) -> int:
+    """
+    Stream an uploaded file to disk, enforcing a size limit as it goes.
+
+    Args:
+        upload: Uploaded file from the request
+        file_path: Destination path
+        max_size: Maximum allowed size in bytes
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        UploadTooLargeError: If the file is larger than max_size.
+            The partially written file is removed.
+    """
+    return await save_stream(_iter_upload(upload), file_path, max_size)
+
+
+def remove_file(file_path: str) -> None:
+    """Delete a file, ignoring errors (missing file, permissions, etc.)."""
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
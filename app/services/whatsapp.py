@@ -3,11 +3,17 @@ WhatsApp Business API service for Hustle.
 Handles messaging, webhooks, and product upload flow.
 """
 
+import asyncio
 import os
-import json
 import re
+import ssl
+from functools import lru_cache
+
+import certifi
 import httpx
-from typing import Optional, Dict, Any
+import orjson
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import quote as _quote
 from uuid import UUID
 
 from app.services.logging import log_action
@@ -19,21 +25,208 @@ WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "")
 WHATSAPP_API_VERSION = "v18.0"
 WHATSAPP_API_BASE = f"https://graph.facebook.com/{WHATSAPP_API_VERSION}"
 
+# A throttled (429) send is retried once after Retry-After, capped since
+# webhook handlers send inline
+RETRY_AFTER_DEFAULT = 1.0  # seconds
+RETRY_AFTER_MAX = 5.0  # seconds
+
+# TLS context built once at import (same CA bundle httpx uses by default)
+_SSL_CTX = ssl.create_default_context(cafile=certifi.where())
+
+# Shared Graph API client: one connection pool for every send, with the
+# base URL and auth headers set once. HTTP/2 (needs h2) multiplexes
+# concurrent sends over one TLS connection. Closed on app shutdown.
+_client = httpx.AsyncClient(
+    base_url=WHATSAPP_API_BASE,
+    headers={
+        "Authorization": f"Bearer {WHATSAPP_API_TOKEN}",
+        "Content-Type": "application/json"
+    },
+    verify=_SSL_CTX,
+    http2=True,
+    limits=httpx.Limits(
+        max_connections=100,
+        max_keepalive_connections=20,
+        keepalive_expiry=60
+    ),
+    timeout=30.0
+)
+
 # Catalog base URL
 CATALOG_BASE_URL = os.getenv("CATALOG_BASE_URL", "https://hustle.app/catalog")
 
+# Click-to-chat link prefix
+_WA_ME = "https://wa.me/"
+
+# Fields shared by every outgoing message payload
+_BASE_PAYLOAD = {"messaging_product": "whatsapp", "recipient_type": "individual"}
+
+# Message templates, filled in with str.format
+_WELCOME_TMPL = """👋 Welcome to Hustle, {name}!
+
+Your private catalog is ready. Here's how it works:
+
+1️⃣ *Upload products*: Send me a photo with product details
+2️⃣ *Confirm*: Tap ✅ to add to your catalog
+3️⃣ *Manage*: Remove products anytime with checkboxes
+4️⃣ *Share*: Copy your catalog link to WhatsApp Status
+5️⃣ *Sell*: Buyers tap "I'm Interested" to message you
+
+*Quick Tips:*
+• Send product photos with name and price in caption
+• You have 30 seconds to undo a removal
+• All actions are logged for your protection
+
+Ready to start selling? Send me your first product photo! 📸"""
+
+_PRODUCT_ADDED_TMPL = """✅ *{product_name}* added to your catalog!
+
+Your catalog now has new items. Share your link on WhatsApp Status to attract buyers.
+
+🔗 {catalog_url}
+
+Send another photo to add more products! 📸"""
+
+_INTEREST_TMPL = """🛒 *New Interest!*
+
+{buyer} is interested in *{product_name}*.
+
+Check your WhatsApp messages to negotiate directly with the buyer.
+
+Keep hustling! 💪"""
+
+# Phone number formatting
+_NON_DIGIT_RE = re.compile(r'\D')
+
+# Caption parsing: "Product Name $50" or "Product Name - $50"
+_PRICE_RE = re.compile(r'[\$£€]?(\d+(?:\.\d{2})?)')
+_NAME_SEP_RE = re.compile(r'[-–—:]$')
+
+
+def parse_caption(caption: str) -> Tuple[str, Optional[float]]:
+    """
+    Extract a product name and price from an image caption.
+    
+    Args:
+        caption: Caption text, e.g. "Red shoes - $25"
+    
+    Returns:
+        Tuple of (name, price); price is None if the caption has no number
+    """
+    if not caption:
+        return "Untitled Product", None
+    
+    price_match = _PRICE_RE.search(caption)
+    if not price_match:
+        # First 50 chars as name
+        return caption[:50], None
+    
+    # Use text before price as name, without a trailing separator
+    name = caption[:price_match.start()].strip() or "Untitled Product"
+    name = _NAME_SEP_RE.sub('', name).strip()
+    return name, float(price_match.group(1))
+
+
+def _format_buttons(buttons: list) -> List[Dict[str, Any]]:
+    """Build reply buttons for the API: at most 3, titles up to 20 chars."""
+    if len(buttons) > 3:
+        buttons = buttons[:3]
+    return [
+        {"type": "reply", "reply": {"id": btn["id"], "title": btn["title"][:20]}}
+        for btn in buttons
+    ]
+
+
+@lru_cache(maxsize=4096)
+def _format_phone_number(phone: str) -> str:
+    """
+    Format phone number for WhatsApp API.
+    Removes non-digits and ensures country code.
+    Cached, since the same numbers are formatted on every send.
+    
+    Args:
+        phone: Raw phone number
+    
+    Returns:
+        Formatted phone number
+    """
+    # Numbers from the database are usually digits already
+    if phone.isdecimal():
+        digits = phone
+    else:
+        # Remove all non-digits
+        digits = _NON_DIGIT_RE.sub('', phone)
+    
+    # Ensure country code (assume +1 if starts with 1 and 11 digits)
+    if len(digits) == 10:
+        # Assume US number, add +1
+        digits = "1" + digits
+    
+    return digits
+
+
+def _parse_text(message: Dict[str, Any], parsed: Dict[str, Any]) -> None:
+    """Add the body of a text message to parsed."""
+    parsed["text"] = message.get("text", {}).get("body", "")
+
+
+def _parse_image(message: Dict[str, Any], parsed: Dict[str, Any]) -> None:
+    """Add the media object and caption of an image message to parsed."""
+    image = message.get("image") or {}
+    parsed["image"] = image
+    parsed["caption"] = image.get("caption", "")
+
+
+def _parse_interactive(message: Dict[str, Any], parsed: Dict[str, Any]) -> None:
+    """Add the button or list reply of an interactive message to parsed."""
+    interactive = message.get("interactive", {})
+    if "button_reply" in interactive:
+        parsed["button_reply"] = interactive["button_reply"]
+    elif "list_reply" in interactive:
+        parsed["list_reply"] = interactive["list_reply"]
+
+
+# Incoming message type -> content parser (see parse_incoming_message)
+_PARSERS = {
+    "text": _parse_text,
+    "image": _parse_image,
+    "interactive": _parse_interactive
+}
+
+
+async def close_whatsapp_client() -> None:
+    """Close the shared Graph API client on shutdown."""
+    await _client.aclose()
+
 
 class WhatsAppService:
     """Service for interacting with WhatsApp Business API."""
     
     def __init__(self):
-        self.api_token = WHATSAPP_API_TOKEN
         self.phone_number_id = WHATSAPP_PHONE_NUMBER_ID
-        self.base_url = WHATSAPP_API_BASE
-        self.headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
+        self.messages_path = f"{self.phone_number_id}/messages"
+    
+    async def _post_message(self, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        POST a message payload, retrying once if the API throttles it.
+        Error statuses are returned, not raised, so callers branch on
+        status_code without exception overhead.
+        """
+        body = orjson.dumps(payload)
+        response = await _client.post(self.messages_path, content=body)
+        if response.status_code == 429:
+            response = await self._retry_after(response, body)
+        return response
+    
+    async def _retry_after(self, response: httpx.Response, body: bytes) -> httpx.Response:
+        """Wait as long as a 429 response's Retry-After asks, then resend."""
+        try:
+            delay = float(response.headers.get("retry-after", RETRY_AFTER_DEFAULT))
+        except ValueError:
+            # HTTP-date form
+            delay = RETRY_AFTER_DEFAULT
+        await asyncio.sleep(min(max(delay, 0.0), RETRY_AFTER_MAX))
+        return await _client.post(self.messages_path, content=body)
     
     async def send_text_message(
         self,
@@ -52,14 +245,11 @@ class WhatsAppService:
         Returns:
             API response dict
         """
-        url = f"{self.base_url}/{self.phone_number_id}/messages"
-        
         # Format phone number (remove non-digits, ensure country code)
-        formatted_phone = self._format_phone_number(to)
+        formatted_phone = _format_phone_number(to)
         
         payload = {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
+            **_BASE_PAYLOAD,
             "to": formatted_phone,
             "type": "text",
             "text": {
@@ -68,36 +258,36 @@ class WhatsAppService:
             }
         }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                # Log the message sent
-                log_action(
-                    action_type=ActionLog.WHATSAPP_MESSAGE_SENT,
-                    action_data={
-                        "to": formatted_phone,
-                        "message_type": "text",
-                        "message_preview": message[:100]
-                    },
-                    whatsapp_message_id=result.get("messages", [{}])[0].get("id")
-                )
-                
-                return {"success": True, "data": result}
-            except httpx.HTTPError as e:
-                error_msg = f"Failed to send WhatsApp message: {str(e)}"
+        try:
+            response = await self._post_message(payload)
+            if response.status_code >= 400:
+                error_msg = f"Failed to send WhatsApp message: HTTP {response.status_code}"
                 log_action(
                     action_type=ActionLog.ERROR_OCCURRED,
                     action_data={"error": error_msg, "phone": formatted_phone}
                 )
                 return {"success": False, "error": error_msg}
+            result = orjson.loads(response.content)
+            
+            # Log the message sent
+            log_action(
+                action_type=ActionLog.WHATSAPP_MESSAGE_SENT,
+                action_data={
+                    "to": formatted_phone,
+                    "message_type": "text",
+                    "message_preview": message[:100]
+                },
+                whatsapp_message_id=result.get("messages", [{}])[0].get("id")
+            )
+            
+            return {"success": True, "data": result}
+        except httpx.HTTPError as e:
+            error_msg = f"Failed to send WhatsApp message: {str(e)}"
+            log_action(
+                action_type=ActionLog.ERROR_OCCURRED,
+                action_data={"error": error_msg, "phone": formatted_phone}
+            )
+            return {"success": False, "error": error_msg}
     
     async def send_image_message(
         self,
@@ -116,13 +306,10 @@ class WhatsAppService:
         Returns:
             API response dict
         """
-        url = f"{self.base_url}/{self.phone_number_id}/messages"
-        
-        formatted_phone = self._format_phone_number(to)
+        formatted_phone = _format_phone_number(to)
         
         payload = {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
+            **_BASE_PAYLOAD,
             "to": formatted_phone,
             "type": "image",
             "image": {
@@ -133,37 +320,34 @@ class WhatsAppService:
         if caption:
             payload["image"]["caption"] = caption
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                log_action(
-                    action_type=ActionLog.WHATSAPP_MESSAGE_SENT,
-                    action_data={
-                        "to": formatted_phone,
-                        "message_type": "image",
-                        "image_url": image_url
-                    },
-                    whatsapp_message_id=result.get("messages", [{}])[0].get("id")
-                )
-                
-                return {"success": True, "data": result}
-            except httpx.HTTPError as e:
-                error_msg = f"Failed to send WhatsApp image: {str(e)}"
+        try:
+            response = await self._post_message(payload)
+            if response.status_code >= 400:
+                error_msg = f"Failed to send WhatsApp image: HTTP {response.status_code}"
                 return {"success": False, "error": error_msg}
+            result = orjson.loads(response.content)
+            
+            log_action(
+                action_type=ActionLog.WHATSAPP_MESSAGE_SENT,
+                action_data={
+                    "to": formatted_phone,
+                    "message_type": "image",
+                    "image_url": image_url
+                },
+                whatsapp_message_id=result.get("messages", [{}])[0].get("id")
+            )
+            
+            return {"success": True, "data": result}
+        except httpx.HTTPError as e:
+            error_msg = f"Failed to send WhatsApp image: {str(e)}"
+            return {"success": False, "error": error_msg}
     
     async def send_interactive_buttons(
         self,
         to: str,
         message: str,
-        buttons: list
+        buttons: list,
+        header_image_url: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Send an interactive message with buttons.
@@ -172,29 +356,18 @@ class WhatsAppService:
             to: Recipient phone number
             message: Message body
             buttons: List of button dicts with 'id' and 'title'
+            header_image_url: Optional image shown above the message body
         
         Returns:
             API response dict
         """
-        url = f"{self.base_url}/{self.phone_number_id}/messages"
+        formatted_phone = _format_phone_number(to)
         
-        formatted_phone = self._format_phone_number(to)
-        
-        # Format buttons for WhatsApp API
-        formatted_buttons = [
-            {
-                "type": "reply",
-                "reply": {
-                    "id": btn["id"],
-                    "title": btn["title"][:20]  # WhatsApp limit
-                }
-            }
-            for btn in buttons[:3]  # Max 3 buttons
-        ]
+        # Format buttons for WhatsApp API (max 3, 20-char titles)
+        formatted_buttons = _format_buttons(buttons)
         
         payload = {
-            "messaging_product": "whatsapp",
-            "recipient_type": "individual",
+            **_BASE_PAYLOAD,
             "to": formatted_phone,
             "type": "interactive",
             "interactive": {
@@ -207,32 +380,33 @@ class WhatsAppService:
                 }
             }
         }
+        if header_image_url:
+            payload["interactive"]["header"] = {
+                "type": "image",
+                "image": {"link": header_image_url}
+            }
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                
-                log_action(
-                    action_type=ActionLog.WHATSAPP_MESSAGE_SENT,
-                    action_data={
-                        "to": formatted_phone,
-                        "message_type": "interactive_buttons",
-                        "button_count": len(buttons)
-                    },
-                    whatsapp_message_id=result.get("messages", [{}])[0].get("id")
-                )
-                
-                return {"success": True, "data": result}
-            except httpx.HTTPError as e:
-                error_msg = f"Failed to send interactive message: {str(e)}"
+        try:
+            response = await self._post_message(payload)
+            if response.status_code >= 400:
+                error_msg = f"Failed to send interactive message: HTTP {response.status_code}"
                 return {"success": False, "error": error_msg}
+            result = orjson.loads(response.content)
+            
+            log_action(
+                action_type=ActionLog.WHATSAPP_MESSAGE_SENT,
+                action_data={
+                    "to": formatted_phone,
+                    "message_type": "interactive_buttons",
+                    "button_count": len(buttons)
+                },
+                whatsapp_message_id=result.get("messages", [{}])[0].get("id")
+            )
+            
+            return {"success": True, "data": result}
+        except httpx.HTTPError as e:
+            error_msg = f"Failed to send interactive message: {str(e)}"
+            return {"success": False, "error": error_msg}
     
     async def send_upload_confirmation(
         self,
@@ -255,26 +429,21 @@ class WhatsAppService:
         Returns:
             API response dict
         """
-        # First send the image
-        caption = f"📦 *{product_name}*"
+        # Image, details and buttons go out as one message: a single API
+        # call, and the buttons can never arrive before the image
+        message = f"📦 *{product_name}*"
         if price:
-            caption += f"\n💰 Price: {price}"
-        caption += "\n\nAdd this product to your catalog?"
-        
-        image_result = await self.send_image_message(to, image_url, caption)
-        
-        if not image_result["success"]:
-            return image_result
-        
-        # Then send confirmation buttons
-        message = f"Tap ✅ to add *{product_name}* to your catalog, or ❌ to cancel."
+            message += f"\n💰 Price: {price}"
+        message += "\n\nTap ✅ to add it to your catalog, or ❌ to cancel."
         
         buttons = [
             {"id": f"confirm_add_{product_id}", "title": "✅ Add"},
             {"id": f"cancel_add_{product_id}", "title": "❌ Cancel"}
         ]
         
-        return await self.send_interactive_buttons(to, message, buttons)
+        return await self.send_interactive_buttons(
+            to, message, buttons, header_image_url=image_url
+        )
     
     async def send_welcome_message(
         self,
@@ -293,24 +462,7 @@ class WhatsAppService:
         Returns:
             API response dict
         """
-        name = seller_name or "there"
-        
-        message = f"""👋 Welcome to Hustle, {name}!
-
-Your private catalog is ready. Here's how it works:
-
-1️⃣ *Upload products*: Send me a photo with product details
-2️⃣ *Confirm*: Tap ✅ to add to your catalog
-3️⃣ *Manage*: Remove products anytime with checkboxes
-4️⃣ *Share*: Copy your catalog link to WhatsApp Status
-5️⃣ *Sell*: Buyers tap "I'm Interested" to message you
-
-*Quick Tips:*
-• Send product photos with name and price in caption
-• You have 30 seconds to undo a removal
-• All actions are logged for your protection
-
-Ready to start selling? Send me your first product photo! 📸"""
+        message = _WELCOME_TMPL.format(name=seller_name or "there")
         
         if catalog_url:
             message += f"\n\n🔗 Your catalog: {catalog_url}"
@@ -334,13 +486,10 @@ Ready to start selling? Send me your first product photo! 📸"""
         Returns:
             API response dict
         """
-        message = f"""✅ *{product_name}* added to your catalog!
-
-Your catalog now has new items. Share your link on WhatsApp Status to attract buyers.
-
-🔗 {catalog_url}
-
-Send another photo to add more products! 📸"""
+        message = _PRODUCT_ADDED_TMPL.format(
+            product_name=product_name,
+            catalog_url=catalog_url
+        )
         
         return await self.send_text_message(to, message)
     
@@ -361,39 +510,13 @@ Send another photo to add more products! 📸"""
         Returns:
             API response dict
         """
-        buyer = buyer_name or "Someone"
-        
-        message = f"""🛒 *New Interest!*
-
-{buyer} is interested in *{product_name}*.
-
-Check your WhatsApp messages to negotiate directly with the buyer.
-
-Keep hustling! 💪"""
+        message = _INTEREST_TMPL.format(
+            buyer=buyer_name or "Someone",
+            product_name=product_name
+        )
         
         return await self.send_text_message(to, message)
     
-    def _format_phone_number(self, phone: str) -> str:
-        """
-        Format phone number for WhatsApp API.
-        Removes non-digits and ensures country code.
-        
-        Args:
-            phone: Raw phone number
-        
-        Returns:
-            Formatted phone number
-        """
-        # Remove all non-digits
-        digits = re.sub(r'\D', '', phone)
-        
-        # Ensure country code (assume +1 if starts with 1 and 11 digits)
-        if len(digits) == 10:
-            # Assume US number, add +1
-            digits = "1" + digits
-        
-        return digits
-    
     def generate_whatsapp_deep_link(
         self,
         phone_number: str,
@@ -409,14 +532,12 @@ Keep hustling! 💪"""
         Returns:
             WhatsApp deep link
         """
-        formatted_phone = self._format_phone_number(phone_number)
+        formatted_phone = _format_phone_number(phone_number)
         
         if message:
-            import urllib.parse
-            encoded_message = urllib.parse.quote(message)
-            return f"https://wa.me/{formatted_phone}?text={encoded_message}"
+            return f"{_WA_ME}{formatted_phone}?text={_quote(message)}"
         
-        return f"https://wa.me/{formatted_phone}"
+        return f"{_WA_ME}{formatted_phone}"
     
     def parse_incoming_message(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
@@ -429,51 +550,39 @@ Keep hustling! 💪"""
             Parsed message dict or None
         """
         try:
-            entry = payload.get("entry", [{}])[0]
-            changes = entry.get("changes", [{}])[0]
-            value = changes.get("value", {})
-            
-            if "messages" not in value:
-                return None
-            
+            value = payload["entry"][0]["changes"][0]["value"]
             message = value["messages"][0]
-            
-            parsed = {
-                "message_id": message.get("id"),
-                "from": message.get("from"),
-                "timestamp": message.get("timestamp"),
-                "type": message.get("type"),
-                "profile": value.get("contacts", [{}])[0].get("profile", {})
-            }
-            
-            # Extract message content based on type
-            if message.get("type") == "text":
-                parsed["text"] = message.get("text", {}).get("body", "")
-            elif message.get("type") == "image":
-                parsed["image"] = message.get("image", {})
-                parsed["caption"] = message.get("image", {}).get("caption", "")
-            elif message.get("type") == "interactive":
-                interactive = message.get("interactive", {})
-                if "button_reply" in interactive:
-                    parsed["button_reply"] = interactive["button_reply"]
-                elif "list_reply" in interactive:
-                    parsed["list_reply"] = interactive["list_reply"]
-            
-            # Log received message
-            log_action(
-                action_type=ActionLog.WHATSAPP_MESSAGE_RECEIVED,
-                action_data={
-                    "from": parsed["from"],
-                    "message_type": parsed["type"],
-                    "message_id": parsed["message_id"]
-                },
-                whatsapp_message_id=parsed["message_id"]
-            )
-            
-            return parsed
-            
-        except (KeyError, IndexError) as e:
+        except (KeyError, IndexError, TypeError):
+            # Not a message event (e.g. a status update)
             return None
+        
+        contacts = value.get("contacts")
+        
+        parsed = {
+            "message_id": message.get("id"),
+            "from": message.get("from"),
+            "timestamp": message.get("timestamp"),
+            "type": message.get("type"),
+            "profile": contacts[0].get("profile", {}) if contacts else {}
+        }
+        
+        # Extract message content based on type
+        parser = _PARSERS.get(parsed["type"])
+        if parser:
+            parser(message, parsed)
+        
+        # Log received message
+        log_action(
+            action_type=ActionLog.WHATSAPP_MESSAGE_RECEIVED,
+            action_data={
+                "from": parsed["from"],
+                "message_type": parsed["type"],
+                "message_id": parsed["message_id"]
+            },
+            whatsapp_message_id=parsed["message_id"]
+        )
+        
+        return parsed
 
 
 # Singleton instance
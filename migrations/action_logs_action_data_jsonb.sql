@@ -0,0 +1,9 @@
+-- Convert action_logs.action_data from TEXT to JSONB on an existing
+-- database. New databases get JSONB from init_db (create_all), so this is
+-- only needed for tables created before the column type changed.
+--
+-- Run once, e.g.:  psql "$DATABASE_URL" -f migrations/action_logs_action_data_jsonb.sql
+-- Existing values were written with json.dumps, so they cast cleanly. The
+-- table is rewritten under an exclusive lock; run it at a quiet time.
+
+ALTER TABLE action_logs ALTER COLUMN action_data TYPE jsonb USING action_data::jsonb;
@@ -0,0 +1,36 @@
+-- Add the trigger-maintained sellers.catalog_views counter to an existing
+-- database. New databases get it from init_db (create_all), so this is only
+-- needed for tables created before the counter was introduced.
+--
+-- Run once, e.g.:  psql "$DATABASE_URL" -f migrations/seller_catalog_views.sql
+-- Restart the app afterwards: seller stats check for the column once per
+-- process and count from action_logs until it exists.
+
+BEGIN;
+
+ALTER TABLE sellers ADD COLUMN IF NOT EXISTS catalog_views BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_seller_catalog_views() RETURNS trigger AS $$
+BEGIN
+    UPDATE sellers SET catalog_views = catalog_views + 1 WHERE id = NEW.seller_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Hold off new log rows until the trigger is in place and the counter is
+-- backfilled, so no view is missed or counted twice
+LOCK TABLE action_logs IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS trg_action_logs_catalog_views ON action_logs;
+CREATE TRIGGER trg_action_logs_catalog_views
+AFTER INSERT ON action_logs
+FOR EACH ROW WHEN (NEW.action_type = 'catalog_viewed')
+EXECUTE FUNCTION bump_seller_catalog_views();
+
+UPDATE sellers SET catalog_views = (
+    SELECT count(*) FROM action_logs
+    WHERE action_logs.seller_id = sellers.id
+      AND action_logs.action_type = 'catalog_viewed'
+);
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- Add the composite indexes for seller product listings and per-seller
+-- action log queries to an existing database. New databases get them from
+-- init_db (create_all), which never adds indexes to tables that already exist.
+--
+-- Run once, e.g.:  psql "$DATABASE_URL" -f migrations/seller_query_indexes.sql
+-- CONCURRENTLY keeps the tables writable while the indexes build; it cannot
+-- run inside a transaction block, so do not wrap this file in BEGIN/COMMIT.
+
+-- Active products of a seller, newest first (catalog and seller product list)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_product_seller_active_created
+    ON products (seller_id, created_at DESC) WHERE is_active = true;
+
+-- Per-seller counts and listings of one action type (e.g. catalog views)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_action_log_seller_type_time
+    ON action_logs (seller_id, action_type, created_at DESC);
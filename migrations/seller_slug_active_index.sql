@@ -0,0 +1,10 @@
+-- Add the partial catalog-lookup index on sellers to an existing database.
+-- New databases get it from init_db (create_all), which never adds indexes
+-- to tables that already exist.
+--
+-- Run once, e.g.:  psql "$DATABASE_URL" -f migrations/seller_slug_active_index.sql
+-- CONCURRENTLY keeps the table writable while the index builds; it cannot
+-- run inside a transaction block, so do not wrap this file in BEGIN/COMMIT.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_seller_slug_active
+    ON sellers (catalog_slug) WHERE is_active = true;